@@ -0,0 +1,271 @@
+"""
+End-to-end benchmark: App's fetchers and notifiers against the local stand-ins of THORNode, Midgard and
+the Telegram Bot API (see stubs.py). Redis is the real one, so point REDIS_HOST/REDIS_PORT at a throwaway instance.
+
+Every tick the synthetic chain makes one block, then each fetcher ticks once and we wait for its notifiers.
+
+Usage (from app/):
+    python -m bench.run --ticks 50 --profile degraded --out ../bench-results.json
+    python -m bench.run --compare ../bench-before.json ../bench-after.json
+"""
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import ujson
+from prodict import Prodict
+
+from bench.stubs import World, ThorNodeCohort, MidgardStub, TelegramStub, PROFILES
+from main import App
+from services.fetch.base import FETCH_ERRORS
+from services.lib.config import Config
+from services.lib.db import REDIS_COMMAND_SECONDS
+from services.lib.http_client import HttpClient
+from services.lib.loop_monitor import LoopLagMonitor
+
+RESULTS_VERSION = 1
+
+
+def percentile(values, q):
+    """ Nearest-rank, q in 0...1 """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, min(len(values) - 1, math.ceil(q * len(values)) - 1))]
+
+
+def summary(values):
+    return {
+        'p50': percentile(values, 0.5),
+        'p99': percentile(values, 0.99),
+        'mean': sum(values) / len(values) if values else 0.0,
+        'max': max(values, default=0.0),
+    }
+
+
+def redis_counts():
+    return {dict(labels).get('command', '?'): n for labels, n in REDIS_COMMAND_SECONDS.counts().items()}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 ** 2 if sys.platform == 'darwin' else rss / 1024  # bytes on macOS, KiB on Linux
+
+
+class FetcherResults:
+    def __init__(self):
+        self.fetch = []  # fetch + dispatch
+        self.end_to_end = []  # ... + all the notifiers done
+        self.redis_ops = []
+        self.redis_by_command = defaultdict(int)
+
+    def as_dict(self, name):
+        busy = sum(self.end_to_end)
+        ticks = len(self.end_to_end)
+        return {
+            'ticks': ticks,
+            'errors': int(FETCH_ERRORS.value(fetcher=name)),
+            'ticks_per_sec': ticks / busy if busy else 0.0,
+            'fetch_sec': summary(self.fetch),
+            'end_to_end_sec': summary(self.end_to_end),
+            'redis_ops_per_tick': sum(self.redis_ops) / ticks if ticks else 0.0,
+            'redis_ops_by_command': dict(self.redis_by_command),
+        }
+
+
+def config_section(cfg, *path):
+    """ cfg[path[0]][path[1]]..., the missing ones are created as Prodicts, so the app can read them as attributes """
+    for name in path:
+        if not isinstance(cfg.get(name), dict):
+            cfg[name] = Prodict()
+        cfg = cfg[name]
+    return cfg
+
+
+def make_config(args, cohort: ThorNodeCohort, midgard: MidgardStub, telegram: TelegramStub) -> Config:
+    cfg = Config(args.config)
+    config_section(cfg, 'thornode')['seed'] = midgard.seed_url
+    config_section(cfg, 'http')['url_overrides'] = {**midgard.url_overrides, **cohort.url_overrides}
+    bot_cfg = config_section(cfg, 'telegram', 'bot')
+    bot_cfg['token'] = '123456789:bench'
+    bot_cfg['api_server'] = telegram.base_url
+    cfg['recorder'] = {'mode': 'off'}
+    # the bench time is compressed: a new block every tick, so nothing may be cached by time
+    config_section(cfg, 'thornode', 'consensus')['height_ttl'] = 0
+    config_section(cfg, 'thornode', 'cache')['latest_ttl'] = 0
+    return cfg
+
+
+async def run_bench(args):
+    world = World(n_pools=args.pools, tx_per_tick=args.tx_per_tick, seed=args.seed)
+    cohort = ThorNodeCohort(world, n_nodes=args.nodes, profile=PROFILES[args.profile], port=args.thornode_port,
+                            seed=args.seed)
+    midgard = MidgardStub(world, cohort.ips[:3], port=args.midgard_port)
+    telegram = TelegramStub(port=args.telegram_port)
+    for stub in (cohort, midgard, telegram):
+        await stub.start()
+
+    app = App(make_config(args, cohort, midgard, telegram))
+    d = app.deps
+    fetchers = []
+    lag_monitor = LoopLagMonitor()
+    lag_task = asyncio.ensure_future(lag_monitor.run())
+    try:
+        app.create_bot_stuff()
+        await app.connect_chat_storage()
+        d.http = HttpClient(d.cfg.get('http', {}))
+        await d.http.start()
+        await app.create_thor_node_connector()
+        fetchers = app.create_fetchers()
+        await app.ppf.get_current_pool_data_full()
+
+        if args.trace_memory:
+            tracemalloc.start()
+
+        results = {f.name: FetcherResults() for f in fetchers}
+        start_ts = time.monotonic()
+        for tick in range(args.ticks):
+            world.advance()
+            for fetcher in fetchers:
+                r = results[fetcher.name]
+                redis_before = redis_counts()
+                tick_ts = time.monotonic()
+                await fetcher.run_once()
+                r.fetch.append(time.monotonic() - tick_ts)
+                await fetcher.join_delegates()
+                r.end_to_end.append(time.monotonic() - tick_ts)
+
+                ops = 0
+                for command, n in redis_counts().items():
+                    delta = n - redis_before.get(command, 0)
+                    r.redis_by_command[command] += delta
+                    ops += delta
+                r.redis_ops.append(ops)
+            if (tick + 1) % 10 == 0:
+                logging.info(f'bench: {tick + 1}/{args.ticks} ticks done')
+        wall_time = time.monotonic() - start_ts
+    finally:
+        lag_task.cancel()
+        for fetcher in fetchers:
+            fetcher.stop_delegates()
+        if d.http:
+            await d.http.close()
+        if d.bot:
+            await d.bot.session.close()
+        if d.db.redis:
+            await d.db.close_redis()
+        for stub in (cohort, midgard, telegram):
+            await stub.stop()
+
+    memory = {'rss_max_mb': max_rss_mb()}
+    if args.trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        memory.update(traced_mb=current / 1024 ** 2, traced_peak_mb=peak / 1024 ** 2)
+
+    n_ticks = args.ticks * len(fetchers)
+    return {
+        'version': RESULTS_VERSION,
+        'commit': git_commit(),
+        'timestamp': int(time.time()),
+        'python': platform.python_version(),
+        'params': vars(args),
+        'wall_time_sec': wall_time,
+        'ticks_per_sec': n_ticks / wall_time if wall_time else 0.0,
+        'fetchers': {name: r.as_dict(name) for name, r in results.items()},
+        'thornode': cohort.stats(),
+        'midgard': dict(midgard.stats),
+        'telegram': {'calls': dict(telegram.stats), 'bytes_received': telegram.bytes_received},
+        'loop_max_lag_sec': lag_monitor.max_lag,
+        'memory': memory,
+    }
+
+
+def print_report(res):
+    print(f'commit {res["commit"]}, {res["params"]["ticks"]} ticks, profile "{res["params"]["profile"]}": '
+          f'{res["wall_time_sec"]:.1f} sec, {res["ticks_per_sec"]:.1f} fetcher ticks/sec')
+    print(f'{"fetcher":<20} {"ticks":>5} {"err":>4} {"fetch p50":>10} {"p99":>8} {"e2e p50":>8} {"p99":>8} '
+          f'{"redis/tick":>10}')
+    for name, f in res['fetchers'].items():
+        print(f'{name:<20} {f["ticks"]:>5} {f["errors"]:>4} {f["fetch_sec"]["p50"]:>10.3f} '
+              f'{f["fetch_sec"]["p99"]:>8.3f} {f["end_to_end_sec"]["p50"]:>8.3f} {f["end_to_end_sec"]["p99"]:>8.3f} '
+              f'{f["redis_ops_per_tick"]:>10.1f}')
+    print(f'telegram: {res["telegram"]["calls"]}; loop max lag: {res["loop_max_lag_sec"]:.3f} sec; '
+          f'memory: {res["memory"]}')
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = ujson.load(f)
+    with open(new_path) as f:
+        new = ujson.load(f)
+
+    def change(a, b):
+        return f'{(b - a) / a * 100.0:+.0f}%' if a else '-'
+
+    print(f'{old["commit"]} -> {new["commit"]}')
+    for name, nf in new['fetchers'].items():
+        of = old['fetchers'].get(name)
+        if not of:
+            continue
+        for metric in ('fetch_sec', 'end_to_end_sec'):
+            for q in ('p50', 'p99'):
+                a, b = of[metric][q], nf[metric][q]
+                print(f'{name:<20} {metric:<15} {q}: {a:.3f} -> {b:.3f} ({change(a, b)})')
+        a, b = of['redis_ops_per_tick'], nf['redis_ops_per_tick']
+        print(f'{name:<20} redis ops/tick: {a:.1f} -> {b:.1f} ({change(a, b)})')
+    a, b = old['memory']['rss_max_mb'], new['memory']['rss_max_mb']
+    print(f'max RSS: {a:.0f} -> {b:.0f} MB ({change(a, b)})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='THORChain monitor bot benchmark')
+    parser.add_argument('--config', default='../example_config.yaml', help='base config, stub URLs are put into it')
+    parser.add_argument('--ticks', type=int, default=30)
+    parser.add_argument('--profile', default='healthy', choices=sorted(PROFILES.keys()),
+                        help='latency and faults of THORNodes')
+    parser.add_argument('--nodes', type=int, default=6)
+    parser.add_argument('--pools', type=int, default=20)
+    parser.add_argument('--tx-per-tick', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--thornode-port', type=int, default=1317)
+    parser.add_argument('--midgard-port', type=int, default=8180)
+    parser.add_argument('--telegram-port', type=int, default=8181)
+    parser.add_argument('--trace-memory', action='store_true', help='tracemalloc; slows everything down')
+    parser.add_argument('--out', help='save the results as JSON here')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    logging.basicConfig(level=os.environ.get('BENCH_LOG_LEVEL', 'WARNING'))
+    res = asyncio.get_event_loop().run_until_complete(run_bench(args))
+    print_report(res)
+    if args.out:
+        with open(args.out, 'w') as f:
+            ujson.dump(res, f, indent=2, escape_forward_slashes=False)
+        print(f'saved to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+import asyncio
+import logging
+import random
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import List
+
+import ujson
+from aiohttp import web
+
+from services.models.time_series import BUSD_SYMBOL, USDT_SYMBOL, BNB_SYMBOL, BTCB_SYMBOL, ETHB_SYMBOL, RUNE_SYMBOL
+
+E8 = 10 ** 8
+
+
+class World:
+    """
+    The synthetic chain behind all the stand-ins. Nothing changes between advance() calls,
+    so the honest THORNodes always agree with each other; a few recent blocks are kept for "?height=" requests
+    and for the lagging nodes.
+    """
+
+    MAX_TXS = 2000
+    HISTORY = 20  # blocks
+
+    def __init__(self, n_pools=20, tx_per_tick=5, big_tx_ratio=0.1, pool_change_rate=0.3, seed=42):
+        self.rng = random.Random(seed)
+        self.tx_per_tick = tx_per_tick
+        self.big_tx_ratio = big_tx_ratio
+        self.pool_change_rate = pool_change_rate
+
+        self.height = 1_000_000
+        self.pools = OrderedDict()
+        real_assets = [BUSD_SYMBOL, USDT_SYMBOL, BNB_SYMBOL, BTCB_SYMBOL, ETHB_SYMBOL]
+        fake_assets = [f'BNB.TKN{i}-{i:03X}' for i in range(max(0, n_pools - len(real_assets)))]
+        for asset in (real_assets + fake_assets)[:max(n_pools, len(real_assets))]:
+            balance_rune = self.rng.randint(100_000, 20_000_000) * E8
+            self.pools[asset] = {
+                'asset': asset,
+                'balance_rune': balance_rune,
+                'balance_asset': int(balance_rune * self.rng.uniform(0.01, 5.0)),
+                'pool_units': balance_rune // 2,
+                'status': 'Enabled',
+            }
+        self.queue = {'swap': 0, 'outbound': 0}
+        self.total_staked = sum(p['balance_rune'] for p in self.pools.values())
+        self.max_staked = self.total_staked * 11 // 10
+        self.txs = []  # newest first as Midgard has it
+        self.n_txs = 0
+        self.run_id = int(time.time() * 1000)  # the bot keeps the seen txs in Redis between the runs
+
+        self._history = OrderedDict()  # height -> {path: body}
+        for _ in range(self.HISTORY):
+            self.height += 1
+            self._snapshot()
+
+    # ---- state ----
+
+    def _snapshot(self):
+        pools = [{k: str(v) for k, v in pool.items()} for pool in self.pools.values()]
+        bodies = {
+            '/thorchain/pools': ujson.dumps(pools).encode(),
+            '/thorchain/queue': ujson.dumps(self.queue).encode(),
+        }
+        for pool in pools:
+            bodies[f'/thorchain/pool/{pool["asset"]}'] = ujson.dumps(pool).encode()
+        self._history[self.height] = bodies
+        while len(self._history) > self.HISTORY:
+            self._history.popitem(last=False)
+
+    def body(self, path, height=None, lag=0):
+        """ None if there is no such path or the height is unknown """
+        height = (self.height - lag) if height is None else height
+        bodies = self._history.get(height)
+        return bodies.get(path) if bodies else None
+
+    def _new_tx(self):
+        asset = self.rng.choice(list(self.pools.keys()))
+        pool = self.pools[asset]
+        share = 0.06 if self.rng.random() < self.big_tx_ratio else self.rng.uniform(0.0001, 0.002)
+        rune_amount = int(pool['balance_rune'] * share)
+        asset_amount = rune_amount * pool['balance_asset'] // pool['balance_rune']
+        self.n_txs += 1
+        tx_hash = f'{self.run_id:016X}{self.n_txs:048X}'
+        address = f'bnb1bench{self.n_txs % 97:032d}'
+        if self.rng.random() < 0.7:
+            pool['balance_rune'] += rune_amount
+            pool['balance_asset'] += asset_amount
+            self.total_staked += rune_amount
+            return {
+                'type': 'stake', 'pool': asset, 'status': 'Success', 'date': str(int(time.time())),
+                'in': {'txID': tx_hash, 'address': address, 'coins': [
+                    {'asset': asset, 'amount': str(asset_amount)},
+                    {'asset': RUNE_SYMBOL, 'amount': str(rune_amount)},
+                ]},
+                'out': [],
+            }
+        else:
+            pool['balance_rune'] -= rune_amount
+            pool['balance_asset'] -= asset_amount
+            self.total_staked -= rune_amount
+            return {
+                'type': 'unstake', 'pool': asset, 'status': 'Success', 'date': str(int(time.time())),
+                'in': {'txID': tx_hash, 'address': address, 'coins': [{'asset': RUNE_SYMBOL, 'amount': '1'}]},
+                'out': [
+                    {'coins': [{'asset': asset, 'amount': str(asset_amount)}]},
+                    {'coins': [{'asset': RUNE_SYMBOL, 'amount': str(rune_amount)}]},
+                ],
+            }
+
+    def advance(self):
+        """ One more block: new transactions, pool drift and the queue """
+        self.height += 1
+        for _ in range(self.tx_per_tick):
+            self.txs.insert(0, self._new_tx())
+        del self.txs[self.MAX_TXS:]
+
+        for pool in self.pools.values():
+            if self.rng.random() < self.pool_change_rate:
+                pool['balance_asset'] = int(pool['balance_asset'] * self.rng.uniform(0.995, 1.005))
+
+        busy = self.rng.random() < 0.2
+        self.queue = {'swap': self.rng.randint(5, 50) if busy else 0, 'outbound': self.rng.randint(0, 3)}
+        self._snapshot()
+
+
+async def _start_site(app: web.Application, host, port):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port, shutdown_timeout=0.1).start()
+    return runner
+
+
+@dataclass
+class NodeProfile:
+    latency: float = 0.02  # sec
+    jitter: float = 0.01  # sec, +- uniform
+    error_rate: float = 0.0  # HTTP 500
+    hang_rate: float = 0.0  # no answer in time, the client has to time out
+    wrong_rate: float = 0.0  # answers with different data
+    lag: int = 0  # blocks behind the others
+
+
+PROFILES = {
+    'healthy': [NodeProfile()],
+    'degraded': [
+        NodeProfile(),
+        NodeProfile(latency=0.3, jitter=0.2),
+        NodeProfile(error_rate=0.3),
+        NodeProfile(),
+        NodeProfile(wrong_rate=0.2),
+        NodeProfile(lag=2),
+    ],
+    'chaos': [
+        NodeProfile(latency=0.1, jitter=0.1),
+        NodeProfile(latency=0.8, jitter=0.5, error_rate=0.1),
+        NodeProfile(hang_rate=0.2),
+        NodeProfile(error_rate=0.3),
+        NodeProfile(wrong_rate=0.3, lag=1),
+        NodeProfile(latency=0.05, lag=2),
+    ],
+}
+
+
+class ThorNodeStub:
+    def __init__(self, world: World, ip, port, profile: NodeProfile, all_ips, rng: random.Random):
+        self.world = world
+        self.ip = ip
+        self.port = port
+        self.profile = profile
+        self.all_ips = all_ips
+        self.rng = rng
+        self.stats = Counter()
+        self._runner = None
+
+    async def _handle(self, request: web.Request):
+        p = self.profile
+        self.stats['requests'] += 1
+        await asyncio.sleep(max(0.0, p.latency + self.rng.uniform(-p.jitter, p.jitter)))
+
+        roll = self.rng.random()
+        if roll < p.hang_rate:
+            self.stats['hangs'] += 1
+            await asyncio.sleep(60.0)
+        if roll < p.hang_rate + p.error_rate:
+            self.stats['errors'] += 1
+            raise web.HTTPInternalServerError()
+
+        path = request.path
+        if path == '/thorchain/nodeaccounts':
+            body = ujson.dumps([{
+                'ip_address': ip, 'status': 'active', 'requested_to_leave': False, 'forced_to_leave': False
+            } for ip in self.all_ips]).encode()
+        elif path == '/thorchain/lastblock':
+            body = ujson.dumps([{'chain': 'BNB', 'thorchain': str(self.world.height - p.lag)}]).encode()
+        else:
+            height = request.query.get('height')
+            height = int(height) if height else None
+            if height is not None and height > self.world.height - p.lag:
+                self.stats['errors'] += 1
+                raise web.HTTPNotFound()  # we're not there yet
+            body = self.world.body(path, height, p.lag)
+            if body is None:
+                raise web.HTTPNotFound()
+
+        if self.rng.random() < p.wrong_rate:
+            self.stats['wrong'] += 1
+            body = body.replace(b'0', b'1', 1)
+        return web.Response(body=body, content_type='application/json')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self._handle)
+        self._runner = await _start_site(app, self.ip, self.port)
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class ThorNodeCohort:
+    """ THORNodes listen on the same port of different loopback addresses: 127.0.0.2, 127.0.0.3, ... """
+
+    THORNODE_PORT = 1317  # the bot always connects to it, see ThorNodeAddressManager.connection_url
+
+    def __init__(self, world: World, n_nodes=6, profile: List[NodeProfile] = None, port=THORNODE_PORT, seed=42):
+        profile = profile or PROFILES['healthy']
+        rng = random.Random(seed)
+        ips = [f'127.0.0.{i + 2}' for i in range(n_nodes)]
+        self.port = port
+        self.nodes = [
+            ThorNodeStub(world, ip, port, profile[i % len(profile)], ips, rng) for i, ip in enumerate(ips)
+        ]
+
+    @property
+    def ips(self):
+        return [node.ip for node in self.nodes]
+
+    @property
+    def url_overrides(self):
+        """ For HttpClient, if the nodes listen on another port """
+        if self.port == self.THORNODE_PORT:
+            return {}
+        return {f'http://{ip}:{self.THORNODE_PORT}': f'http://{ip}:{self.port}' for ip in self.ips}
+
+    async def start(self):
+        for node in self.nodes:
+            await node.start()
+
+    async def stop(self):
+        for node in self.nodes:
+            await node.stop()
+
+    def stats(self):
+        return {node.ip: dict(node.stats) for node in self.nodes}
+
+
+class MidgardStub:
+    """
+    Midgard v1 (txs, network, mimir, history/pools) plus everything else the fetchers ask:
+    the THORNode seed list, Delphi Digital market data and CoinGecko. Use url_overrides to point them here.
+    """
+
+    def __init__(self, world: World, seed_ips, host='127.0.0.1', port=8180, latency=0.02):
+        self.world = world
+        self.seed_ips = seed_ips
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.stats = Counter()
+        self._runner = None
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    @property
+    def url_overrides(self):
+        return {
+            'https://chaosnet-midgard.bepswap.com': self.base_url,
+            'https://defi.delphidigital.io': self.base_url,
+            'https://api.coingecko.com': self.base_url,
+        }
+
+    @property
+    def seed_url(self):
+        return f'{self.base_url}/seed'
+
+    def _json(self, request: web.Request, data):
+        self.stats[request.path] += 1
+        return web.Response(body=ujson.dumps(data).encode(), content_type='application/json')
+
+    async def _txs(self, request: web.Request):
+        await asyncio.sleep(self.latency)
+        offset, limit = int(request.query.get('offset', 0)), int(request.query.get('limit', 50))
+        txs = self.world.txs
+        return self._json(request, {'count': len(txs), 'txs': txs[offset:offset + limit]})
+
+    async def _network(self, request):
+        await asyncio.sleep(self.latency)
+        return self._json(request, {'totalStaked': str(self.world.total_staked)})
+
+    async def _mimir(self, request):
+        await asyncio.sleep(self.latency)
+        return self._json(request, {'mimir//MAXIMUMSTAKERUNE': str(self.world.max_staked)})
+
+    async def _history_pools(self, request: web.Request):
+        await asyncio.sleep(self.latency)
+        pool = self.world.pools.get(request.query.get('pool'), next(iter(self.world.pools.values())))
+        return self._json(request, [{
+            'assetDepth': str(pool['balance_asset']), 'runeDepth': str(pool['balance_rune'])
+        }])
+
+    async def _seed(self, request):
+        return self._json(request, self.seed_ips)
+
+    async def _delphi_market_data(self, request):
+        return self._json(request, {'circulating': str(500_000_000)})
+
+    async def _delphi_vault(self, request):
+        return self._json(request, 50_000_000)
+
+    async def _gecko_coin(self, request):
+        return self._json(request, {'market_cap_rank': 42})
+
+    async def _gecko_chart(self, request):
+        now_ms = int(time.time() * 1000)
+        return self._json(request, {'prices': [[now_ms - i * 3_600_000, 1.0] for i in range(24)]})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/v1/txs', self._txs)
+        app.router.add_get('/v1/network', self._network)
+        app.router.add_get('/v1/thorchain/mimir', self._mimir)
+        app.router.add_get('/v1/history/pools', self._history_pools)
+        app.router.add_get('/seed', self._seed)
+        app.router.add_get('/chaosnet/int/marketdata', self._delphi_market_data)
+        app.router.add_get('/chaosnet/int/runevaultBalance', self._delphi_vault)
+        app.router.add_get('/api/v3/coins/thorchain', self._gecko_coin)
+        app.router.add_get('/api/v3/coins/thorchain/market_chart', self._gecko_chart)
+        self._runner = await _start_site(app, self.host, self.port)
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class TelegramStub:
+    """ Bot API: every method succeeds and returns a message, see telegram.bot.api_server """
+
+    def __init__(self, host='127.0.0.1', port=8181, latency=0.03):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.stats = Counter()  # method -> calls
+        self.bytes_received = 0
+        self._runner = None
+        self.logger = logging.getLogger('TelegramStub')
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    async def _handle(self, request: web.Request):
+        body = await request.read()
+        self.bytes_received += len(body)
+        method = request.match_info['method']
+        self.stats[method] += 1
+        await asyncio.sleep(self.latency)
+        result = {
+            'message_id': sum(self.stats.values()),
+            'date': int(time.time()),
+            'chat': {'id': -1001, 'type': 'channel', 'title': 'bench'},
+        }
+        return web.Response(body=ujson.dumps({'ok': True, 'result': result}).encode(),
+                            content_type='application/json')
+
+    async def start(self):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self._handle)
+        self._runner = await _start_site(app, self.host, self.port)
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
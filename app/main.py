@@ -1,10 +1,11 @@
 import asyncio
 import logging
 import os
+import signal
+from urllib.parse import urlparse
 
-import aiohttp
-import ujson
 from aiogram import Bot, Dispatcher, executor
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.types import *
 
 from localization import LocalizationManager
@@ -14,11 +15,20 @@ from services.fetch.gecko_price import fill_rune_price_from_gecko
 from services.fetch.node_ip_manager import ThorNodeAddressManager
 from services.fetch.pool_price import PoolPriceFetcher
 from services.fetch.queue import QueueFetcher
+from services.fetch.thor_cache import ThorNodeCache
 from services.fetch.thor_node import ThorNode
 from services.fetch.tx import StakeTxFetcher
 from services.lib.config import Config
+from services.lib.datetime import parse_timespan_to_seconds
 from services.lib.db import DB
 from services.lib.depcont import DepContainer
+from services.lib.http_client import HttpClient, UPSTREAM_THORNODE
+from services.lib.loop_monitor import LoopLagMonitor
+from services.lib.metrics import MetricsServer
+from services.lib.recorder import HttpRecorder, MODE_OFF
+from services.lib.snapshot import SnapshotPublisher, SnapshotSubscriber, SNAPSHOT_POOLS, SNAPSHOT_QUEUE, \
+    SNAPSHOT_CAP
+from services.lib.supervisor import JobSupervisor
 from services.models.price import LastPriceHolder
 from services.notify.broadcast import Broadcaster
 from services.notify.types.cap_notify import CapFetcherNotifier
@@ -27,11 +37,15 @@ from services.notify.types.price_notify import PriceNotifier
 from services.notify.types.queue_notify import QueueNotifier
 from services.notify.types.tx_notify import StakeTxNotifier
 
+ROLE_ALL = 'all'  # everything in one process
+ROLE_COLLECTOR = 'collector'  # fetchers and notifiers; publishes the snapshots to Redis for the frontends
+ROLE_FRONTEND = 'frontend'  # answers the users with the data from the snapshots; can be more than one
+
 
 class App:
-    def __init__(self):
+    def __init__(self, cfg: Config = None):
         d = self.deps = DepContainer()
-        d.cfg = Config()
+        d.cfg = cfg or Config()
 
         log_level = d.cfg.get('log_level', logging.INFO)
         logging.basicConfig(
@@ -40,18 +54,24 @@ class App:
             datefmt='%Y-%m-%d %H:%M:%S',
         )
 
+        self.role = os.environ.get('BOT_ROLE') or d.cfg.get('role', ROLE_ALL)
+        assert self.role in (ROLE_ALL, ROLE_COLLECTOR, ROLE_FRONTEND), f'unknown role "{self.role}"'
+
         logging.info('-' * 100)
-        logging.info(f"Log level: {log_level}")
+        logging.info(f"Log level: {log_level}; role: {self.role}")
 
         d.loop = asyncio.get_event_loop()
         d.db = DB(d.loop)
 
         d.price_holder = LastPriceHolder()
+        self.fetcher_tx = None
 
     def create_bot_stuff(self):
         d = self.deps
 
-        d.bot = Bot(token=d.cfg.telegram.bot.token, parse_mode=ParseMode.HTML)
+        api_server = d.cfg.telegram.bot.get('api_server')  # a local Bot API server
+        d.bot = Bot(token=d.cfg.telegram.bot.token, parse_mode=ParseMode.HTML,
+                    server=TelegramAPIServer.from_base(api_server) if api_server else TELEGRAM_PRODUCTION)
         d.dp = Dispatcher(d.bot, loop=d.loop)
         d.loc_man = LocalizationManager()
         d.broadcaster = Broadcaster(d)
@@ -65,60 +85,161 @@ class App:
     async def create_thor_node_connector(self):
         d = self.deps
         cfg = d.cfg.thornode
-        d.thor_man = ThorNodeAddressManager(cfg.seed)
-        d.thor_man.session = d.session
-        d.thor_nodes = ThorNode(d.thor_man, d.session,
+        health_cfg = cfg.get('health', {})
+        d.thor_man = ThorNodeAddressManager(
+            cfg.seed,
+            refresh_period=parse_timespan_to_seconds(cfg.get('refresh_period', '10m')),
+            blacklist_time=parse_timespan_to_seconds(health_cfg.get('blacklist_time', '10m')),
+            max_error_rate=float(health_cfg.get('max_error_rate', 0.5)),
+            max_disagree_rate=float(health_cfg.get('max_disagree_rate', 0.3)),
+            circuit_failures=int(health_cfg.get('circuit_failures', 3)),
+            circuit_open_time=parse_timespan_to_seconds(health_cfg.get('circuit_open_time', '30s')),
+            min_timeout=float(health_cfg.get('min_timeout', 0.5)),
+            max_timeout=d.http.timeouts[UPSTREAM_THORNODE],
+            timeout_factor=float(health_cfg.get('timeout_factor', 2.0)))
+        d.thor_man.http = d.http
+        cache_cfg = cfg.get('cache', {})
+        cache = ThorNodeCache(d.db,
+                              max_items=int(cache_cfg.get('memory_items', 1000)),
+                              latest_ttl=float(cache_cfg.get('latest_ttl', 5.0)))
+        d.thor_nodes = ThorNode(d.thor_man, d.http,
                                 cohort_size=cfg.consensus.cohort,
-                                consensus=cfg.consensus.agree)
+                                consensus=cfg.consensus.agree,
+                                early_quorum=bool(cfg.consensus.get('early_quorum', True)),
+                                hedge_delay=float(cfg.consensus.get('hedge_delay', 0.5)),
+                                max_extra_requests=int(cfg.consensus.get('max_extra_requests', 2)),
+                                cache=cache,
+                                height_sync_paths=cfg.consensus.get('height_sync', ()),
+                                height_lag=int(cfg.consensus.get('height_lag', 1)),
+                                height_ttl=float(cfg.consensus.get('height_ttl', 5.0)),
+                                stream_verify=bool(cfg.consensus.get('stream_verify', True)))
         await d.thor_man.reload_nodes_ip()
 
-    async def _run_background_jobs(self):
+    def create_fetchers(self):
         d = self.deps
+        self.ppf = PoolPriceFetcher(d)
+        self.fetcher_cap = CapInfoFetcher(d, ppf=self.ppf)
+        self.fetcher_tx = StakeTxFetcher(d)
+        self.fetcher_queue = QueueFetcher(d)
+
+        self.fetcher_cap.subscribe(CapFetcherNotifier(d))
+        self.fetcher_tx.subscribe(StakeTxNotifier(d))
+        self.fetcher_queue.subscribe(QueueNotifier(d))
+        self.ppf.subscribe(PriceNotifier(d))
+        self.ppf.subscribe(PoolChurnNotifier(d))
+
+        if self.role == ROLE_COLLECTOR:
+            self.ppf.subscribe(SnapshotPublisher(d, SNAPSHOT_POOLS))
+            self.fetcher_queue.subscribe(SnapshotPublisher(d, SNAPSHOT_QUEUE))
+            self.fetcher_cap.subscribe(SnapshotPublisher(d, SNAPSHOT_CAP))
+        return [self.ppf, self.fetcher_queue, self.fetcher_cap, self.fetcher_tx]
 
-        if 'REPLACE_RUNE_TIMESERIES_WITH_GECKOS' in os.environ:
-            await fill_rune_price_from_gecko(d.db)
+    async def _run_background_jobs(self):
+        d = self.deps
 
-        self.ppf = PoolPriceFetcher(d)
-        await self.ppf.get_current_pool_data_full()
-
-        fetcher_cap = CapInfoFetcher(d, ppf=self.ppf)
-        fetcher_tx = StakeTxFetcher(d)
-        fetcher_queue = QueueFetcher(d)
-
-        notifier_cap = CapFetcherNotifier(d)
-        notifier_tx = StakeTxNotifier(d)
-        notifier_queue = QueueNotifier(d)
-        notifier_price = PriceNotifier(d)
-        notifier_pool_churn = PoolChurnNotifier(d)
-
-        fetcher_cap.subscribe(notifier_cap)
-        fetcher_tx.subscribe(notifier_tx)
-        fetcher_queue.subscribe(notifier_queue)
-        self.ppf.subscribe(notifier_price)
-        self.ppf.subscribe(notifier_pool_churn)
-
-        await asyncio.gather(*(task.run() for task in [
-            self.ppf,
-            fetcher_tx,
-            fetcher_cap,
-            fetcher_queue,
-        ]))
+        if self.role == ROLE_FRONTEND:
+            snapshots = SnapshotSubscriber(d)
+            await snapshots.load()
+        else:
+            if 'REPLACE_RUNE_TIMESERIES_WITH_GECKOS' in os.environ:
+                await fill_rune_price_from_gecko(d.db, d.http)
+
+            self.create_fetchers()
+            await self.ppf.get_current_pool_data_full()
+
+        sv = self.supervisor
+        lag_cfg = d.cfg.get('loop_monitor', {})
+        if lag_cfg.get('enabled', True):
+            lag_monitor = LoopLagMonitor(interval=float(lag_cfg.get('interval', 0.5)),
+                                         threshold=float(lag_cfg.get('threshold', 0.25)))
+            sv.register('LoopLagMonitor', lag_monitor.run, priority=20)
+        sv.register('ThorNodeAddressManager', d.thor_man.run, priority=10)
+        sv.register('HttpClient', d.http.run)
+        sv.register('JobSupervisor', sv.run)
+        if self.role == ROLE_FRONTEND:
+            sv.register('SnapshotSubscriber', snapshots.run, priority=5)
+        else:
+            sv.register_fetcher(self.ppf, priority=5, heavy=True)
+            sv.register_fetcher(self.fetcher_queue, priority=3)
+            sv.register_fetcher(self.fetcher_cap, priority=2)
+            sv.register_fetcher(self.fetcher_tx, priority=1, heavy=True)
+        sv.start()
 
     async def on_startup(self, _):
         await self.connect_chat_storage()
 
-        self.deps.session = aiohttp.ClientSession(json_serialize=ujson.dumps)
+        d = self.deps
+        d.http = HttpClient(d.cfg.get('http', {}))
+        await d.http.start()
+
+        rec_cfg = d.cfg.get('recorder', {})
+        rec_mode = rec_cfg.get('mode') or MODE_OFF  # YAML turns a bare off into False
+        if rec_mode != MODE_OFF:
+            d.http.recorder = HttpRecorder(rec_cfg.get('path', 'http_record.jsonl.gz'),
+                                           mode=rec_mode,
+                                           timing=rec_cfg.get('timing', 'original'))
         await self.create_thor_node_connector()
 
-        asyncio.create_task(self._run_background_jobs())
+        sv_cfg = d.cfg.get('supervisor', {})
+        self.supervisor = JobSupervisor(
+            max_heavy_jobs=int(sv_cfg.get('max_heavy_jobs', 1)),
+            restart_delay=parse_timespan_to_seconds(sv_cfg.get('restart_delay', '5s')),
+            max_restart_delay=parse_timespan_to_seconds(sv_cfg.get('max_restart_delay', '5m')),
+            stats_period=parse_timespan_to_seconds(sv_cfg.get('stats_period', '1h')))
+        self._startup_task = asyncio.create_task(self._run_background_jobs())
+
+        metrics_cfg = d.cfg.get('metrics', {})
+        self.metrics_server = None
+        if metrics_cfg.get('enabled', False):
+            self.metrics_server = MetricsServer(metrics_cfg.get('host', '0.0.0.0'), int(metrics_cfg.get('port', 9090)))
+            await self.metrics_server.start()
+
+        if self.webhook_url:
+            await d.bot.set_webhook(self.webhook_url)
 
     async def on_shutdown(self, _):
-        await self.deps.session.close()
+        self._startup_task.cancel()
+        await self.supervisor.stop()
+        if self.fetcher_tx:
+            n = await self.fetcher_tx.flush_pool_stats()  # the write-behind pool stats
+            logging.info(f'{n} pool stats saved on shutdown')
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await self.deps.http.close()
+        if self.deps.http.recorder:
+            self.deps.http.recorder.close()
+
+    @property
+    def webhook_url(self):
+        if self.role == ROLE_COLLECTOR:
+            return None
+        return self.deps.cfg.telegram.get('webhook', {}).get('url')
+
+    def run_collector(self):
+        # no Telegram updates here, the bot only sends the notifications
+        loop = self.deps.loop
+        loop.run_until_complete(self.on_startup(None))
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, loop.stop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(self.on_shutdown(None))
+            loop.run_until_complete(self.deps.bot.session.close())
 
     def run_bot(self):
         self.create_bot_stuff()
-        executor.start_polling(self.deps.dp, skip_updates=True, on_startup=self.on_startup,
-                               on_shutdown=self.on_shutdown)
+        if self.role == ROLE_COLLECTOR:
+            self.run_collector()
+        elif self.webhook_url:
+            # many frontends can share the webhook behind a load balancer, but only one can poll
+            webhook_cfg = self.deps.cfg.telegram.webhook
+            executor.start_webhook(self.deps.dp, webhook_path=urlparse(self.webhook_url).path or '/',
+                                   skip_updates=True, on_startup=self.on_startup, on_shutdown=self.on_shutdown,
+                                   host=webhook_cfg.get('host', '0.0.0.0'), port=int(webhook_cfg.get('port', 8080)))
+        else:
+            executor.start_polling(self.deps.dp, skip_updates=True, on_startup=self.on_startup,
+                                   on_shutdown=self.on_shutdown)
 
 
 if __name__ == '__main__':
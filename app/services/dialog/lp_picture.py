@@ -7,13 +7,13 @@ from datetime import datetime
 from typing import List
 
 import aiofiles
-import aiohttp
 from PIL import Image, ImageDraw, ImageFont
 
 from localization import BaseLocalization
 from localization.base import RAIDO_GLYPH
+from services.lib.http_client import HttpClient
 from services.lib.money import asset_name_cut_chain, pretty_money, short_asset_name, pretty_dollar
-from services.lib.plot_graph import PlotBarGraph
+from services.lib.plot_graph import PlotBarGraph, RENDER_SECONDS
 from services.lib.texts import grouper
 from services.lib.utils import Singleton, async_wrap
 from services.models.stake_info import StakePoolReport, StakeDayGraphPoint
@@ -67,21 +67,20 @@ class Resources(metaclass=Singleton):
         else:
             return Resources.COIN_LOGO.format(asset=asset_name_cut_chain(asset))
 
-    async def download_logo(self, asset):
-        async with aiohttp.ClientSession() as session:
-            url = self.image_url(asset)
-            logging.info(f'Downloading logo for {asset} from {url}...')
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    f = await aiofiles.open(self.LOCAL_COIN_LOGO.format(asset=asset), mode='wb')
-                    await f.write(await resp.read())
-                    await f.close()
-
-    async def download_logo_cached(self, asset):
+    async def download_logo(self, http: HttpClient, asset):
+        url = self.image_url(asset)
+        logging.info(f'Downloading logo for {asset} from {url}...')
+        status, data = await http.get_bytes(url)
+        if status == 200:
+            f = await aiofiles.open(self.LOCAL_COIN_LOGO.format(asset=asset), mode='wb')
+            await f.write(data)
+            await f.close()
+
+    async def download_logo_cached(self, http: HttpClient, asset):
         try:
             local_path = self.LOCAL_COIN_LOGO.format(asset=asset)
             if not os.path.exists(local_path):
-                await self.download_logo(asset)
+                await self.download_logo(http, asset)
             logo = Image.open(local_path).convert("RGBA")
         except:
             logo = Image.open(self.UNKNOWN_LOGO)
@@ -119,12 +118,12 @@ def is_stable_coin(pool):
     return pool == BUSD_SYMBOL
 
 
-async def lp_pool_picture(report: StakePoolReport, loc: BaseLocalization, value_hidden=False):
+async def lp_pool_picture(http: HttpClient, report: StakePoolReport, loc: BaseLocalization, value_hidden=False):
     r = Resources()
     asset = report.pool.asset
     rune_image, asset_image = await asyncio.gather(
-        r.download_logo_cached(RUNE_SYMBOL),
-        r.download_logo_cached(asset)
+        r.download_logo_cached(http, RUNE_SYMBOL),
+        r.download_logo_cached(http, asset)
     )
     return await sync_lp_pool_picture(report, loc, rune_image, asset_image, value_hidden)
 
@@ -134,6 +133,7 @@ def hor_line(draw, y, width=2, w=WIDTH, h=HEIGHT):
 
 
 @async_wrap
+@RENDER_SECONDS.timed(kind='lp_pool')
 def sync_lp_pool_picture(report: StakePoolReport, loc: BaseLocalization, rune_image, asset_image, value_hidden):
     asset = report.pool.asset
 
@@ -460,6 +460,7 @@ def lp_weekly_graph(w, h, weekly_charts: dict, color_map: dict, value_hidden):
 
 
 @async_wrap
+@RENDER_SECONDS.timed(kind='lp_address_summary')
 def sync_lp_address_summary_picture(reports: List[StakePoolReport], weekly_charts, loc: BaseLocalization, value_hidden):
     total_added_value_usd = sum(r.added_value(r.USD) for r in reports)
     total_added_value_rune = sum(r.added_value(r.RUNE) for r in reports)
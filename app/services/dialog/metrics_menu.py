@@ -51,7 +51,9 @@ class MetricsDialog(BaseDialog):
                              disable_notification=True)
 
     async def show_cap(self, message: Message):
-        info = await ThorInfo.get_old_cap(self.deps.db)
+        info = self.deps.cap_holder
+        if not info.is_ok:
+            info = await ThorInfo.get_old_cap(self.deps.db)
         await message.answer(self.loc.cap_message(info),
                              disable_web_page_preview=True,
                              disable_notification=True)
@@ -96,7 +98,7 @@ class MetricsDialog(BaseDialog):
 
     @message_handler(state=MetricsStates.PRICE_SELECT_DURATION)
     async def on_price_duration_answered(self, message: Message):
-        fp = await fair_rune_price(self.deps.price_holder)
+        fp = await fair_rune_price(self.deps.price_holder, self.deps.http)
         pn = PriceNotifier(self.deps)
         price_1h, price_24h, price_7d = await pn.historical_get_triplet()
         fp.real_rune_price = self.deps.price_holder.usd_per_rune
@@ -1,8 +1,23 @@
 import asyncio
 import logging
+import random
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
 
+from services.lib.datetime import parse_timespan_to_seconds, parse_timespan_float
 from services.lib.depcont import DepContainer
+from services.lib.metrics import Histogram, Counter
+
+FETCH_SECONDS = Histogram('fetch_duration_seconds', 'BaseFetcher.fetch duration')
+FETCH_ERRORS = Counter('fetch_errors_total', 'Failed fetches')
+NOTIFY_SECONDS = Histogram('notify_duration_seconds', 'Delegate on_data duration')
+NOTIFY_ERRORS = Counter('notify_errors_total', 'Failed or timed out on_data calls')
+NOTIFY_DROPPED = Counter('notify_dropped_total', 'Stale data dropped by busy delegates')
+
+
+class FetcherGaveUp(Exception):
+    """ Too many failed ticks in a row: run() quits, so the supervisor restarts it after a backoff """
 
 
 class INotified(ABC):
@@ -13,13 +28,121 @@ class INotified(ABC):
         ...
 
 
+@dataclass
+class DelegateStats:
+    delivered: int = 0
+    dropped: int = 0  # stale data replaced by a fresher one before the delegate got to it
+    errors: int = 0
+    timeouts: int = 0
+    last_duration: float = 0.0
+    max_duration: float = 0.0
+    total_duration: float = 0.0
+
+    @property
+    def avg_duration(self):
+        return self.total_duration / self.delivered if self.delivered else 0.0
+
+    def __str__(self):
+        return (f'delivered={self.delivered}, dropped={self.dropped}, errors={self.errors}, '
+                f'timeouts={self.timeouts}, avg={self.avg_duration:.2f}s, max={self.max_duration:.2f}s')
+
+
+class DelegateWorker:
+    """
+    Feeds one delegate from its own task, so a slow delegate holds up neither the fetcher nor the other delegates.
+    latest_wins: the mailbox keeps only the freshest data; otherwise it is a FIFO queue and nothing is lost
+    """
+
+    def __init__(self, sender, delegate: INotified, timeout=None, latest_wins=True):
+        self.sender = sender
+        self.delegate = delegate
+        self.name = delegate.__class__.__name__
+        self.timeout = timeout
+        self.latest_wins = latest_wins
+        self.stats = DelegateStats()
+        self.logger = logging.getLogger(f'{sender.name}->{self.name}')
+        self._mailbox = asyncio.Queue(maxsize=1 if latest_wins else 0)
+        self._task = None
+
+    def put(self, data):
+        if self.latest_wins and self._mailbox.full():
+            self._mailbox.get_nowait()
+            self._mailbox.task_done()
+            self.stats.dropped += 1
+            NOTIFY_DROPPED.inc(delegate=self.name)
+            self.logger.warning(f'the delegate is busy, dropped the stale data ({self.stats}).')
+        self._mailbox.put_nowait(data)
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._work())
+
+    async def _work(self):
+        while True:
+            data = await self._mailbox.get()
+            start_ts = time.monotonic()
+            try:
+                await asyncio.wait_for(self.delegate.on_data(self.sender, data), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+                NOTIFY_ERRORS.inc(delegate=self.name, error='timeout')
+                self.logger.error(f'on_data timeout ({self.timeout} sec)!')
+            except Exception as e:
+                self.stats.errors += 1
+                NOTIFY_ERRORS.inc(delegate=self.name, error=e.__class__.__name__)
+                self.logger.exception(f'on_data error: {e}')
+            finally:
+                duration = time.monotonic() - start_ts
+                NOTIFY_SECONDS.observe(duration, delegate=self.name)
+                self.stats.delivered += 1
+                self.stats.last_duration = duration
+                self.stats.total_duration += duration
+                self.stats.max_duration = max(self.stats.max_duration, duration)
+                self._mailbox.task_done()
+
+    async def join(self):
+        """ Waits until the delegate has handled all the data put so far """
+        await self._mailbox.join()
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
 class BaseFetcher(ABC):
-    def __init__(self, deps: DepContainer, sleep_period=60):
+    MISSED_TICK_SKIP = 'skip'  # stay on the grid, the ticks that passed during a long fetch are lost
+    MISSED_TICK_COALESCE = 'coalesce'  # the missed ticks become a single tick right away
+
+    def __init__(self, deps: DepContainer, sleep_period=60, adaptive_cfg=None):
         self.deps = deps
         self.name = self.__class__.__qualname__
         self.sleep_period = sleep_period
         self.logger = logging.getLogger(f'{self.__class__.__name__}')
         self.delegates = set()
+        self._workers = {}  # delegate -> DelegateWorker
+        self.latest_wins = True  # False if the delegates must see every piece of data (see DelegateWorker)
+        self.job = None  # set by JobSupervisor.register_fetcher
+
+        cfg = deps.cfg.get('fetcher', {}) if deps.cfg else {}
+        self.jitter = parse_timespan_float(cfg.get('jitter', 0))
+        self.deadline = parse_timespan_float(cfg.get('deadline', 0))  # 0 = sleep_period
+        self.missed_tick = cfg.get('missed_tick', self.MISSED_TICK_SKIP)
+        assert self.missed_tick in (self.MISSED_TICK_SKIP, self.MISSED_TICK_COALESCE)
+        self.delegate_timeout = parse_timespan_float(cfg.get('delegate_timeout', 0)) or None
+
+        # data with the same fingerprint as the last time goes to the delegates only once per heartbeat
+        self.heartbeat = parse_timespan_to_seconds(cfg.get('heartbeat', '5m'))
+        self.max_errors_in_row = int(cfg.get('max_errors_in_row', 10))  # 0 = keep trying forever
+        self._errors_in_row = 0
+        self._last_fingerprint = None
+        self._last_pass_ts = 0.0
+
+        # adaptive polling: the period grows up to max_period while the data stays the same
+        # and drops to min_period as soon as it changes or gets "hot" (see fingerprint, is_hot)
+        adaptive_cfg = adaptive_cfg or {}
+        self.min_period = parse_timespan_to_seconds(adaptive_cfg.get('min_period', 0))
+        self.max_period = parse_timespan_to_seconds(adaptive_cfg.get('max_period', 0))
+        self.backoff_factor = float(adaptive_cfg.get('backoff_factor', 1.5))
 
     def subscribe(self, delegate: INotified):
         self.delegates.add(delegate)
@@ -29,26 +152,139 @@ class BaseFetcher(ABC):
     async def fetch(self):
         ...
 
+    def dispatch(self, data):
+        for delegate in self.delegates:
+            worker = self._workers.get(delegate)
+            if worker is None:
+                worker = self._workers[delegate] = DelegateWorker(self, delegate, self.delegate_timeout,
+                                                                  self.latest_wins)
+            worker.put(data)
+
+    @property
+    def delegate_stats(self):
+        return {worker.name: worker.stats for worker in self._workers.values()}
+
+    async def join_delegates(self):
+        for worker in list(self._workers.values()):
+            await worker.join()
+
+    def stop_delegates(self):
+        for worker in self._workers.values():
+            worker.stop()
+        self._workers.clear()
+
     async def handle_error(self, e):
         for delegate in self.delegates:
             await delegate.on_error(self, e)
 
-    async def run(self):
-        await asyncio.sleep(1)
-        while True:
+    def fingerprint(self, data):
+        """ Override: a canonical hash of the meaningful part of the data; None = every piece of data is new """
+        return None
+
+    @property
+    def heartbeat_due(self):
+        return time.monotonic() - self._last_pass_ts >= self.heartbeat
+
+    def is_unchanged(self, fingerprint):
+        """ True if the data with this fingerprint may be dropped right away """
+        return fingerprint is not None and fingerprint == self._last_fingerprint and not self.heartbeat_due
+
+    def _check_fingerprint(self, data):
+        """ Returns (changed, should_pass) """
+        fingerprint = self.fingerprint(data)
+        changed = fingerprint is None or fingerprint != self._last_fingerprint
+        self._last_fingerprint = fingerprint
+        if changed or self.heartbeat_due:
+            self._last_pass_ts = time.monotonic()
+            return changed, True
+        return changed, False
+
+    @property
+    def is_adaptive(self):
+        return self.min_period > 0 and self.max_period >= self.min_period
+
+    def is_hot(self, data):
+        """ Override: True if something is about to happen, so we'd better look closely """
+        return False
+
+    def adapt_period(self, data, changed):
+        old_period = self.sleep_period
+        if changed or (data and self.is_hot(data)):
+            self.sleep_period = self.min_period
+        else:
+            self.sleep_period = min(self.max_period, self.sleep_period * self.backoff_factor)
+        if old_period != self.sleep_period:
+            self.logger.info(f'polling period: {old_period:.0f} -> {self.sleep_period:.0f} sec.')
+
+    @property
+    def fetch_deadline(self):
+        return self.deadline or max(self.sleep_period, self.max_period)
+
+    def next_tick_ts(self, last_tick_ts, now):
+        # fixed rate: the next tick is counted from the previous one, not from the end of the work
+        next_ts = last_tick_ts + self.sleep_period
+        if next_ts > now:
+            return next_ts
+
+        n_missed = int((now - next_ts) // self.sleep_period) + 1
+        self.logger.warning(f'fetch overrun: {n_missed} tick(s) missed ({self.missed_tick}).')
+        if self.missed_tick == self.MISSED_TICK_COALESCE:
+            return now
+        else:
+            return next_ts + n_missed * self.sleep_period
+
+    async def run_once(self):
+        if self.job is None:
+            await self._run_once()
+        else:
+            async with self.job.tick():
+                await self._run_once()
+                if self.job.heavy:
+                    await self.join_delegates()  # their work on the data is heavy too, keep it under the cap
+
+    async def _run_once(self):
+        try:
             try:
-                data = await self.fetch()
-                if data:
-                    for delegate in self.delegates:
-                        delegate: INotified
-                        await delegate.on_data(self, data)
+                with FETCH_SECONDS.time(fetcher=self.name):
+                    data = await asyncio.wait_for(self.fetch(), timeout=self.fetch_deadline)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'fetch deadline ({self.fetch_deadline:.1f} sec) exceeded') from None
 
-            except Exception as e:
-                self.logger.exception(f"task error: {e}")
+            changed, should_pass = False, False
+            if data:
+                changed, should_pass = self._check_fingerprint(data)
+
+            if self.is_adaptive:
+                self.adapt_period(data, changed)
+
+            if should_pass:
+                self.dispatch(data)
+            elif data:
+                self.logger.info('nothing changed, the delegates are not bothered.')
+            self._errors_in_row = 0
+
+        except Exception as e:
+            self.logger.exception(f"task error: {e}")
+            FETCH_ERRORS.inc(fetcher=self.name)
+            if self.job:
+                self.job.report_error(e)
 
-                try:
-                    await self.handle_error(e)
-                except Exception as e:
-                    self.logger.exception(f"task error while handling on_error: {e}")
+            try:
+                await self.handle_error(e)
+            except Exception as on_error_e:
+                self.logger.exception(f"task error while handling on_error: {on_error_e}")
+
+            self._errors_in_row += 1
+            if self.max_errors_in_row and self._errors_in_row >= self.max_errors_in_row:
+                raise FetcherGaveUp(f'{self._errors_in_row} failed ticks in a row') from e
+
+    async def run(self):
+        self._errors_in_row = 0
+        await asyncio.sleep(1)
+        tick_ts = time.monotonic()
+        while True:
+            await self.run_once()
 
-            await asyncio.sleep(self.sleep_period)
+            tick_ts = self.next_tick_ts(tick_ts, time.monotonic())
+            jitter = random.uniform(0.0, self.jitter) if self.jitter else 0.0
+            await asyncio.sleep(max(0.0, tick_ts - time.monotonic()) + jitter)
@@ -12,23 +12,29 @@ MIMIR_URL = "https://chaosnet-midgard.bepswap.com/v1/thorchain/mimir"
 class CapInfoFetcher(BaseFetcher):
     def __init__(self, deps: DepContainer, ppf: PoolPriceFetcher):
         self.ppf = ppf
-        sleep_period = parse_timespan_to_seconds(deps.cfg.cap.fetch_period)
-        super().__init__(deps, sleep_period)
+        cfg = deps.cfg.cap
+        sleep_period = parse_timespan_to_seconds(cfg.fetch_period)
+        super().__init__(deps, sleep_period, adaptive_cfg=cfg.get('adaptive'))
+        self.hot_ratio = float(cfg.get('hot_ratio', 0.9))
+
+    def fingerprint(self, data: ThorInfo):
+        return data.fingerprint
+
+    def is_hot(self, data: ThorInfo):
+        return data.is_ok and data.stacked >= data.cap * self.hot_ratio  # the cap is about to be reached
 
     async def fetch(self) -> ThorInfo:
         self.logger.info("start fetching caps and mimir")
 
-        session = self.deps.session
+        http = self.deps.http
 
-        async with session.get(NETWORK_URL) as resp:
-            networks_resp = await resp.json()
-            total_staked = int(networks_resp.get('totalStaked', 0)) * MIDGARD_MULT
+        networks_resp = await http.get_json(NETWORK_URL)
+        total_staked = int(networks_resp.get('totalStaked', 0)) * MIDGARD_MULT
 
-        async with session.get(MIMIR_URL) as resp:
-            mimir_resp = await resp.json()
-            max_staked = int(mimir_resp.get("mimir//MAXIMUMSTAKERUNE", 1)) * MIDGARD_MULT
+        mimir_resp = await http.get_json(MIMIR_URL)
+        max_staked = int(mimir_resp.get("mimir//MAXIMUMSTAKERUNE", 1)) * MIDGARD_MULT
 
-            # max_staked = 90_000_015  # for testing
+        # max_staked = 90_000_015  # for testing
 
         if max_staked <= 1:
             self.logger.error(f"max_staked = {max_staked} and total_staked = {total_staked} which seems like an error")
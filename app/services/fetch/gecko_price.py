@@ -1,9 +1,9 @@
 import logging
 
-import aiohttp
 from aioredis import ReplyError
 from tqdm import tqdm
 
+from services.lib.http_client import HttpClient
 from services.models.time_series import PriceTimeSeries, RUNE_SYMBOL, RUNE_SYMBOL_DET
 
 COIN_CHART_GECKO = "https://api.coingecko.com/api/v3/coins/thorchain/market_chart?vs_currency=usd&days={days}"
@@ -11,17 +11,15 @@ COIN_RANK_GECKO = "https://api.coingecko.com/api/v3/coins/thorchain?" \
                   "tickers=false&market_data=false&community_data=false&developer_data=false"
 
 
-async def get_rune_chart(days):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(COIN_CHART_GECKO.format(days=days)) as resp:
-            j = await resp.json()
-            return j['prices']
+async def get_rune_chart(http: HttpClient, days):
+    j = await http.get_json(COIN_CHART_GECKO.format(days=days))
+    return j['prices']
 
 
-async def fill_rune_price_from_gecko(db, include_fake_det=False, fake_value=0.2):
+async def fill_rune_price_from_gecko(db, http: HttpClient, include_fake_det=False, fake_value=0.2):
     logging.warning('fill_rune_price_from_gecko is called!')
-    gecko_data8 = await get_rune_chart(8)
-    gecko_data1 = await get_rune_chart(1)
+    gecko_data8 = await get_rune_chart(http, 8)
+    gecko_data1 = await get_rune_chart(http, 1)
 
     price_chart = gecko_data8 + gecko_data1
     price_chart.sort(key=lambda p: p[0])
@@ -43,7 +41,5 @@ async def fill_rune_price_from_gecko(db, include_fake_det=False, fake_value=0.2)
             pass
 
 
-async def gecko_info(session):
-    async with session.get(COIN_RANK_GECKO) as resp:
-        j = await resp.json()
-        return j
+async def gecko_info(http: HttpClient):
+    return await http.get_json(COIN_RANK_GECKO)
@@ -21,31 +21,28 @@ class LiqPoolFetcher:
     async def get_my_pools(self, address):
         url = MIDGARD_MY_POOLS.format(address=address)
         self.logger.info(f'get {url}')
-        async with self.deps.session.get(url) as resp:
-            j = await resp.json()
-            try:
-                my_pools = j['poolsArray']
-                return my_pools
-            except KeyError:
-                return None
+        j = await self.deps.http.get_json(url)
+        try:
+            my_pools = j['poolsArray']
+            return my_pools
+        except KeyError:
+            return None
 
     async def fetch_one_pool_liquidity_info(self, address, pool):
         url = ASGARD_CONSUMER_CURRENT_LIQUIDITY.format(address=address, pool=pool)
         self.logger.info(f'get {url}')
-        async with self.deps.session.get(url) as resp:
-            j = await resp.json()
-            return CurrentLiquidity.from_asgard(j)
+        j = await self.deps.http.get_json(url)
+        return CurrentLiquidity.from_asgard(j)
 
     async def fetch_one_pool_weekly_chart(self, address, pool):
         url = ASGARD_CONSUMER_WEEKLY_HISTORY.format(address=address, pool=pool)
         self.logger.info(f'get {url}')
-        async with self.deps.session.get(url) as resp:
-            j = await resp.json()
-            try:
-                return pool, [StakeDayGraphPoint.from_asgard(point) for point in j['data']]
-            except TypeError:
-                self.logger.warning(f'no weekly chart for {pool} @ {address}')
-                return pool, None
+        j = await self.deps.http.get_json(url)
+        try:
+            return pool, [StakeDayGraphPoint.from_asgard(point) for point in j['data']]
+        except TypeError:
+            self.logger.warning(f'no weekly chart for {pool} @ {address}')
+            return pool, None
 
     async def fetch_all_pools_weekly_charts(self, address, pools):
         weekly_charts = await asyncio.gather(*[self.fetch_one_pool_weekly_chart(address, pool) for pool in pools])
@@ -1,6 +1,13 @@
+import asyncio
 import logging
 import random
-from typing import List
+import time
+from collections import defaultdict
+from typing import List, Dict
+from urllib.parse import urlparse
+
+from services.lib.http_client import HttpClient, UPSTREAM_THORNODE
+from services.models.node_health import NodeHealth, CircuitBreaker, CIRCUIT_CLOSED
 
 
 class ThorNodeAddressManager:
@@ -8,22 +15,43 @@ class ThorNodeAddressManager:
     def connection_url(ip_address, path=''):
         return f'http://{ip_address}:1317{path}'
 
-    def __init__(self, seed, session=None, reload_each_n_request=100):
+    NODE_LIST_TIMEOUT = 30.0  # sec, the list is big
+
+    def __init__(self, seed, http: HttpClient = None, refresh_period=600,
+                 blacklist_time=600, max_error_rate=0.5, max_disagree_rate=0.3,
+                 circuit_failures=3, circuit_open_time=30.0,
+                 min_timeout=0.5, max_timeout=3.0, timeout_factor=2.0):
         assert seed
         self.logger = logging.getLogger('ThorNodeAddressManager')
         self.nodes_ip = []
         self.seed_url = seed
-        self._cnt = 0
-        self._black_list = set()
-        self.reload_each_n_request = reload_each_n_request
-        self.session = session
+        self._black_list: Dict[str, float] = {}  # ip -> expiration timestamp
+        self.refresh_period = refresh_period
+        self._reload_lock = asyncio.Lock()
+        self.http = http
         self._rng = random.SystemRandom()
 
+        self.blacklist_time = blacklist_time
+        self.max_error_rate = max_error_rate
+        self.max_disagree_rate = max_disagree_rate
+        self.circuit_failures = circuit_failures
+        self.circuit_open_time = circuit_open_time
+        self.node_health: Dict[str, NodeHealth] = defaultdict(self._new_node_health)
+
+        # per node and path class: p95 of the recent latencies * timeout_factor, clamped
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_factor = timeout_factor
+
+    def _new_node_health(self):
+        return NodeHealth(breaker=CircuitBreaker(failure_threshold=self.circuit_failures,
+                                                 open_time=self.circuit_open_time,
+                                                 max_open_time=self.blacklist_time))
+
     async def get_seed_nodes(self):
-        assert self.session
+        assert self.http
         self.logger.info(f'Using seed URL: {self.seed_url}')
-        async with self.session.get(self.seed_url) as resp:
-            return await resp.json()
+        return await self.http.get_json(self.seed_url, UPSTREAM_THORNODE, coalesce=False)
 
     @staticmethod
     def is_ok_node(node_j):
@@ -34,57 +62,141 @@ class ThorNodeAddressManager:
         )
 
     async def get_thornode_active_list(self, node_ip):
-        assert self.session
+        assert self.http
         url = self.connection_url(node_ip) + "/thorchain/nodeaccounts"
         self.logger.info(f'requesting url: {url}')
-        async with self.session.get(url) as resp:
-            json = await resp.json()
-            nodes = [node['ip_address'] for node in json if self.is_ok_node(node)]
-            self.logger.info(f'total nodes loaded: {len(json)}; active: {len(nodes)} ')
-            return nodes
+        json = await self.http.get_json(url, UPSTREAM_THORNODE, timeout=self.NODE_LIST_TIMEOUT, coalesce=False)
+        nodes = [node['ip_address'] for node in json if self.is_ok_node(node)]
+        self.logger.info(f'total nodes loaded: {len(json)}; active: {len(nodes)} ')
+        return nodes
+
+    async def _race_for_active_list(self, seed_nodes_ip):
+        tasks = {asyncio.ensure_future(self.get_thornode_active_list(ip)): ip for ip in seed_nodes_ip}
+        pending = set(tasks.keys())
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        active_list = task.result()
+                        if not active_list:
+                            raise ValueError('empty')
+                        return active_list
+                    except Exception as e:
+                        self.logger.error(f'failed to get active list from {tasks[task]}: {e}; next!')
+            return []
+        finally:
+            for task in pending:
+                task.cancel()
 
     async def reload_nodes_ip(self):
         seed_nodes_ip = await self.get_seed_nodes()
-        self._rng.shuffle(seed_nodes_ip)
-        for node_ip in seed_nodes_ip:
-            try:
-                active_list = await self.get_thornode_active_list(node_ip)
-                if not active_list:
-                    raise ValueError('empty')
-                else:
-                    self.nodes_ip = active_list
-                    break
-            except Exception as e:
-                self.logger.error(f'failed to get active list from {node_ip}: {e}; next!')
+        active_list = await self._race_for_active_list(seed_nodes_ip)
+        if len(active_list) <= 1:
+            raise LookupError(f'could not load the active node list (got {active_list})')
 
-        assert self.nodes_ip
+        self.nodes_ip = active_list  # swap the whole list at once, nobody sees it half-updated
+
+        for ip in set(self.node_health.keys()) - set(self.nodes_ip):
+            del self.node_health[ip]
 
         self.logger.info(f'active nodes loaded: ({len(self.nodes_ip)}) {self.nodes_ip})')
-        assert len(self.nodes_ip) > 1
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.refresh_period)
+            try:
+                async with self._reload_lock:
+                    await self.reload_nodes_ip()
+            except Exception as e:
+                self.logger.exception(f'node list refresh error: {e}; keep using the old list')
 
     @property
     def valid_nodes(self):
-        return set(self.nodes_ip) - self._black_list
+        now = time.monotonic()
+        expired = [ip for ip, expire_ts in self._black_list.items() if expire_ts <= now]
+        for ip in expired:
+            self.logger.info(f'{ip} is no longer blacklisted.')
+            del self._black_list[ip]
+        return set(ip for ip in self.nodes_ip
+                   if ip not in self._black_list and self.node_health[ip].breaker.is_available(now))
 
     async def select_node(self):
         return (await self.select_nodes(n=1))[0]
 
-    async def select_nodes(self, n) -> List[str]:
+    async def select_nodes(self, n, exclude=()) -> List[str]:
+        if not self.nodes_ip:
+            # cold start only; later the list is refreshed in the background (see run)
+            async with self._reload_lock:
+                if not self.nodes_ip:
+                    await self.reload_nodes_ip()
+
         nodes = self.valid_nodes
+        if not nodes:
+            self.logger.warning('all nodes are blacklisted or their circuits are open; ignoring that')
+            nodes = set(self.nodes_ip)
+
+        nodes = list(nodes - set(exclude))
+        selected = self._weighted_sample(nodes, n)
+        for ip in selected:
+            self.node_health[ip].breaker.on_selected()
+        return selected
 
-        if not nodes or not self.nodes_ip or self._cnt >= self.reload_each_n_request:
-            self._cnt = 0
-            await self.reload_nodes_ip()
-            nodes = self.valid_nodes
-        else:
-            self._cnt += 1
+    def _weighted_sample(self, nodes, n):
+        # Efraimidis-Spirakis: sample without replacement, probabilities are proportional to the weights
+        def key(ip):
+            return self._rng.random() ** (1.0 / self.node_health[ip].weight)
 
-        ips = self._rng.sample(list(nodes), n)
-        return ips
+        return sorted(nodes, key=key, reverse=True)[:n]
 
     async def select_node_url(self):
         return self.connection_url(await self.select_node())
 
-    async def blacklist_node(self, ip, reason='?'):
-        self.logger.warning(f'blacklisting {ip} reason: {reason}.')
-        self._black_list.add(ip)
+    async def blacklist_node(self, ip, reason='?', duration=None):
+        self._blacklist(ip, reason, duration)
+
+    def _blacklist(self, ip, reason='?', duration=None):
+        duration = self.blacklist_time if duration is None else duration
+        self.logger.warning(f'blacklisting {ip} for {duration} sec; reason: {reason}.')
+        self._black_list[ip] = time.monotonic() + duration
+
+    def _check_health(self, ip):
+        health = self.node_health[ip]
+        if health.is_bad(self.max_error_rate, self.max_disagree_rate):
+            self._blacklist(ip, reason=f'poor health ({health})')
+            del self.node_health[ip]  # fresh start after the ban
+
+    @staticmethod
+    def path_class(path: str):
+        # "/thorchain/pool/BNB.BNB?height=1" -> "/thorchain/pool"
+        return '/'.join(urlparse(path).path.split('/')[:3])
+
+    def timeout_for(self, ip, path=''):
+        p95 = self.node_health[ip].latency_quantile(self.path_class(path))
+        if p95 is None:
+            return self.max_timeout  # don't know the node yet
+        return min(self.max_timeout, max(self.min_timeout, p95 * self.timeout_factor))
+
+    def report_success(self, ip, latency, path=''):
+        health = self.node_health[ip]
+        if health.breaker.state != CIRCUIT_CLOSED:
+            self.logger.info(f'{ip} is back, closing its circuit.')
+        health.breaker.on_success()
+        health.report_success(latency, self.path_class(path))
+
+    def report_error(self, ip, latency):
+        health = self.node_health[ip]
+        health.report_error(latency)
+        if health.breaker.on_failure(time.monotonic()):
+            self.logger.warning(f'circuit to {ip} is open for {health.breaker.open_until - time.monotonic():.0f} sec.')
+        self._check_health(ip)
+
+    def report_cancelled(self, ip, elapsed):
+        health = self.node_health[ip]
+        health.breaker.on_cancelled()
+        health.report_cancelled(elapsed)
+
+    def report_vote(self, ip, agreed: bool):
+        self.node_health[ip].report_vote(agreed)
+        if not agreed:
+            self._check_health(ip)
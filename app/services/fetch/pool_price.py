@@ -1,3 +1,5 @@
+import asyncio
+
 from services.fetch.base import BaseFetcher
 from services.fetch.fair_price import fair_rune_price
 from services.lib.datetime import parse_timespan_to_seconds, DAY, HOUR
@@ -13,9 +15,10 @@ class PoolPriceFetcher(BaseFetcher):
     def __init__(self, deps: DepContainer):
         cfg = deps.cfg
         period = parse_timespan_to_seconds(cfg.price.fetch_period)
-        super().__init__(deps, sleep_period=period)
+        super().__init__(deps, sleep_period=period, adaptive_cfg=cfg.price.get('adaptive'))
         self.deps = deps
         self.pool_series = TimeSeries('pool-info', self.deps.db)
+        self.pool_map_fingerprint = None
 
     @staticmethod
     def historic_url(asset, height):
@@ -25,9 +28,17 @@ class PoolPriceFetcher(BaseFetcher):
     def full_pools_url():
         return f"/thorchain/pools"
 
+    def fingerprint(self, data):
+        return self.pool_map_fingerprint
+
     async def fetch(self):
         d = self.deps
-        await self.get_current_pool_data_full()
+        pool_map = await self.get_current_pool_data_full()
+        self.pool_map_fingerprint = PoolInfo.map_fingerprint(pool_map)
+        if self.is_unchanged(self.pool_map_fingerprint):
+            self.logger.info('the pools have not changed, the price is the same.')
+            return None
+
         price = d.price_holder.usd_per_rune
         self.logger.info(f'fresh rune price is ${price:.3f}')
 
@@ -39,7 +50,7 @@ class PoolPriceFetcher(BaseFetcher):
             await pts.add(price=price)
 
             pts_det = PriceTimeSeries(RUNE_SYMBOL_DET, d.db)
-            fair_price = await fair_rune_price(d.price_holder)
+            fair_price = await fair_rune_price(d.price_holder, d.http)
             await pts_det.add(price=fair_price.fair_price)
             fair_price.real_rune_price = price
             return fair_price
@@ -62,8 +73,10 @@ class PoolPriceFetcher(BaseFetcher):
         return asset_per_rune
 
     async def get_historical_price(self, asset, height=0):
-        dollar_per_rune = await self.get_price_in_rune(BUSD_SYMBOL, height)
-        asset_per_rune = await self.get_price_in_rune(asset, height)
+        dollar_per_rune, asset_per_rune = await asyncio.gather(
+            self.get_price_in_rune(BUSD_SYMBOL, height),
+            self.get_price_in_rune(asset, height),
+        )
 
         asset_price_in_usd = dollar_per_rune / asset_per_rune
 
@@ -111,14 +124,13 @@ class PoolPriceFetcher(BaseFetcher):
         url = self.url_for_pool_info_by_day(pool, day)
         self.logger.info(f"get: {url}")
 
-        async with self.deps.session.get(url) as resp:
-            pools_info = await resp.json()
-            if not pools_info:
-                self.logger.warning(f'fetch result = []!')
-            pool_info = pools_info[0]
-            price = int(pool_info['assetDepth']) / int(pool_info['runeDepth'])
-            await self.deps.db.redis.set(cache_key, price)
-            return price
+        pools_info = await self.deps.http.get_json(url)
+        if not pools_info:
+            self.logger.warning(f'fetch result = []!')
+        pool_info = pools_info[0]
+        price = int(pool_info['assetDepth']) / int(pool_info['runeDepth'])
+        await self.deps.db.redis.set(cache_key, price)
+        return price
 
     async def get_usd_per_rune_asset_per_rune_by_day(self, pool, day_ts):
         usd_per_rune = await self.get_asset_per_rune_of_pool_by_day(BUSD_SYMBOL, day_ts)
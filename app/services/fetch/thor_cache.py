@@ -0,0 +1,88 @@
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+import ujson
+
+from services.lib.db import DB
+
+
+class ThorNodeCache:
+    """
+    Responses pinned to an explicit block height never change: they live in memory (LRU) and in Redis forever.
+    The "latest" responses are kept in memory only for a short TTL.
+    Do not mutate the returned objects: they are shared!
+    """
+
+    KEY_PREFIX = 'thor_resp'
+    FOREVER = float('inf')
+
+    def __init__(self, db: DB, max_items=1000, latest_ttl=5.0):
+        self.db = db
+        self.max_items = max_items
+        self.latest_ttl = latest_ttl
+        self._lru = OrderedDict()  # path -> (expire_ts, data)
+        self.logger = logging.getLogger('ThorNodeCache')
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def pinned_height(path) -> int:
+        query = parse_qs(urlparse(path).query)
+        try:
+            return int(query.get('height', ['0'])[0])
+        except ValueError:
+            return 0
+
+    def is_immutable(self, path):
+        return self.pinned_height(path) > 0
+
+    def key(self, path):
+        return f'{self.KEY_PREFIX}:{path}'
+
+    def _remember(self, path, data, expire_ts):
+        self._lru[path] = (expire_ts, data)
+        self._lru.move_to_end(path)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def _recall(self, path):
+        expire_ts, data = self._lru.get(path, (0.0, None))
+        if expire_ts < time.monotonic():
+            return None
+        self._lru.move_to_end(path)
+        return data
+
+    async def get(self, path):
+        data = self._recall(path)
+        if data is None and self.is_immutable(path):
+            try:
+                r = await self.db.get_redis()
+                raw = await r.get(self.key(path))
+                if raw:
+                    data = ujson.loads(raw)
+                    self._remember(path, data, self.FOREVER)
+            except Exception as e:
+                self.logger.error(f'failed to load "{path}" from Redis: {e}')
+
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    async def put(self, path, data):
+        if data is None:
+            return
+
+        if self.is_immutable(path):
+            self._remember(path, data, self.FOREVER)
+            try:
+                r = await self.db.get_redis()
+                await r.set(self.key(path), ujson.dumps(data))
+            except Exception as e:
+                self.logger.error(f'failed to save "{path}" to Redis: {e}')
+        elif self.latest_ttl > 0:
+            self._remember(path, data, time.monotonic() + self.latest_ttl)
@@ -1,63 +1,338 @@
 import asyncio
 import logging
+import time
 from collections import Counter
 from hashlib import sha256
 
 import ujson
-from aiohttp import ClientSession, ClientConnectorError
+from aiohttp import ClientError
 
 from services.fetch.node_ip_manager import ThorNodeAddressManager
+from services.fetch.thor_cache import ThorNodeCache
+from services.lib.http_client import HttpClient, UPSTREAM_THORNODE
+from services.lib.metrics import Histogram, Counter as CounterMetric
+from services.lib.recorder import KIND_THORNODE
+from services.lib.utils import SingleFlight
+
+
+NODE_REQUEST_SECONDS = Histogram('thornode_request_seconds', 'Successful requests to a THORNode')
+NODE_REQUEST_ERRORS = CounterMetric('thornode_request_errors_total', 'Failed requests to a THORNode')
+CONSENSUS_RATIO = Histogram('thornode_consensus_ratio', 'Share of the cohort that agreed',
+                            buckets=(0.2, 0.4, 0.6, 0.8, 1.0))
+CONSENSUS_FAILURES = CounterMetric('thornode_consensus_failures_total', 'Requests with no consensus reached')
 
 
 class ThorNode:
-    def __init__(self, node_ip_man: ThorNodeAddressManager, session: ClientSession, cohort_size=5, consensus=3):
+    def __init__(self, node_ip_man: ThorNodeAddressManager, http: HttpClient, cohort_size=5, consensus=3,
+                 early_quorum=True, hedge_delay=0.5, max_extra_requests=2, cache: ThorNodeCache = None,
+                 height_sync_paths=(), height_lag=1, height_ttl=5.0, stream_verify=True):
         self.node_ip_man = node_ip_man
-        self.session = session
+        self.http = http
+        self.cache = cache
 
         self.cohort_size = cohort_size
         self.consensus = consensus
         assert consensus > 0
         assert cohort_size >= consensus
 
-        self.timeout = 3.0
+        # return as soon as "consensus" equal responses arrived and cancel the stragglers
+        self.early_quorum = early_quorum
+
+        # if no node answers within hedge_delay or the quorum becomes unreachable,
+        # ask fresh nodes, but no more than max_extra_requests per call
+        self.hedge_delay = hedge_delay
+        self.max_extra_requests = max_extra_requests
+
+        # only one body per call is kept in memory for the paths pinned to a height, see _quorum_response
+        self.stream_verify = stream_verify
+
+        # for these paths all cohort members are asked at the same (recent) block height,
+        # so their answers differ only if some node is really faulty
+        self.height_sync_paths = tuple(height_sync_paths)
+        self.height_lag = height_lag  # blocks back from the last one, so that the lagging nodes have it too
+        self.height_ttl = height_ttl  # sec to reuse the learned height
+        self._last_height = 0
+        self._last_height_ts = 0.0
+        self._height_failures = 0
+
         self.logger = logging.getLogger('ThorNode')
+        self._flight = SingleFlight()
+        self._labelled_list = None  # node_ip_man.nodes_ip the per node metrics were trimmed to
+        self._labelled_nodes = frozenset()
 
-    async def _request_one_node_as_text(self, node_ip, path):
+    CHUNK_SIZE = 64 * 1024
+
+    OTHER_NODE = 'other'
+
+    def _node_label(self, node_ip):
+        """ The per node series are kept for the current active list only, so they don't pile up as nodes churn """
+        nodes = self.node_ip_man.nodes_ip
+        if nodes is not self._labelled_list:  # the manager swaps the whole list on refresh
+            self._labelled_list = nodes
+            self._labelled_nodes = frozenset(nodes)
+            for metric in (NODE_REQUEST_SECONDS, NODE_REQUEST_ERRORS):
+                metric.retain('node', self._labelled_nodes | {self.OTHER_NODE})
+        return node_ip if node_ip in self._labelled_nodes else self.OTHER_NODE
+
+    async def _request_one_node(self, node_ip, path, keep_body=True):
+        """ Returns (sha256 hex digest, body or None unless keep_body) or None on failure """
         url = self.node_ip_man.connection_url(node_ip, path)
+        timeout = self.node_ip_man.timeout_for(node_ip, path)
+        recorder = self.http.recorder
+        recording = recorder is not None and recorder.is_recording
+        hasher, chunks, size = sha256(), [], 0
+        start_ts = time.monotonic()
         try:
-            async with self.session.get(url, timeout=self.timeout) as resp:
-                return await resp.text()
-        except (ClientConnectorError, asyncio.TimeoutError) as e:
+            if recorder is not None and recorder.is_replaying:
+                status, body = await recorder.replay(KIND_THORNODE, path)
+                if status != 200:
+                    raise ClientError(f'HTTP status {status}')
+                hasher.update(body)
+                size, chunks = len(body), [body]
+            else:
+                async with self.http.get(url, UPSTREAM_THORNODE, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        raise ClientError(f'HTTP status {resp.status}')
+                    # verifiers hash the raw stream chunk by chunk and never hold the whole body
+                    async for chunk in resp.content.iter_chunked(self.CHUNK_SIZE):
+                        hasher.update(chunk)
+                        size += len(chunk)
+                        if keep_body or recording:
+                            chunks.append(chunk)
+            if not size:
+                raise ClientError('empty response')
+        except (ClientError, asyncio.TimeoutError) as e:
+            if recording:
+                recorder.record(KIND_THORNODE, path, time.monotonic() - start_ts, error=e)
             self.logger.warning(f'Cannot connect to THORNode ({node_ip}) for "{path}" (err: {e}).')
-            return ''
-
-    def _consensus_response(self, text_responses):
-        hash_dict = {i: sha256(r.encode('utf-8')).hexdigest() for i, r in enumerate(text_responses)}
-        counter = Counter(hash_dict.values())
-        most_hash, most_freq = counter.most_common(1)[0]
-        if most_freq >= self.consensus > 0:
-            best_index = next(i for i, this_hash in hash_dict.items() if this_hash == most_hash)
-            return text_responses[best_index], most_freq / self.cohort_size
+            NODE_REQUEST_ERRORS.inc(node=self._node_label(node_ip))
+            self.node_ip_man.report_error(node_ip, time.monotonic() - start_ts)
+            return None
+        except asyncio.CancelledError:
+            # a straggler: we don't know its latency, but it is at least that much
+            self.node_ip_man.report_cancelled(node_ip, time.monotonic() - start_ts)
+            raise
         else:
+            latency = time.monotonic() - start_ts
+            if recording:
+                recorder.record(KIND_THORNODE, path, latency, b''.join(chunks))
+            NODE_REQUEST_SECONDS.observe(latency, node=self._node_label(node_ip))
+            self.node_ip_man.report_success(node_ip, latency, path)
+            return hasher.hexdigest(), (b''.join(chunks) if keep_body else None)
+
+    def _start_requests(self, node_ips, path, task_to_ip: dict, keep_body=True):
+        tasks = set()
+        for ip in node_ips:
+            task = asyncio.ensure_future(self._request_one_node(ip, path, keep_body))
+            task_to_ip[task] = ip
+            tasks.add(task)
+        return tasks
+
+    def _report_votes(self, votes: dict, winner_hash):
+        for ip, this_hash in votes.items():
+            self.node_ip_man.report_vote(ip, agreed=(this_hash == winner_hash))
+
+    async def _fetch_agreed_body(self, winner_hash, votes: dict, path):
+        # the primary failed or was outvoted: take the body from a node that agreed
+        for ip, this_hash in votes.items():
+            if this_hash == winner_hash:
+                result = await self._request_one_node(ip, path, keep_body=True)
+                if result and result[0] == winner_hash:
+                    return result[1]
+                self.logger.warning(f'{ip} could not repeat its response for "{path}".')
+        return None
+
+    @staticmethod
+    async def _await_body(tasks, winner_hash):
+        """ The quorum came before the body: the first agreeing body of the ones still on the way """
+        try:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                if result and result[0] == winner_hash:
+                    return result[1]
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _quorum_response(self, node_ips, path):
+        asked = set(node_ips)
+        task_to_ip = {}
+        # the primary's body is kept; with stream_verify the rest (verifiers) only hash their responses.
+        # Only for the paths pinned to a height: an agreeing node repeats exactly the same body if asked again
+        hash_only = self.stream_verify and ThorNodeCache.pinned_height(path) > 0
+        primary_task, = self._start_requests(node_ips[:1], path, task_to_ip, keep_body=True)
+        pending = {primary_task} | self._start_requests(node_ips[1:], path, task_to_ip, keep_body=not hash_only)
+        body_tasks = set(pending) if not hash_only else {primary_task}
+        extra_budget = self.max_extra_requests
+        counter = Counter()
+        bodies, votes = {}, {}
+        winner_hash = None
+        body_waits = set()
+        try:
+            while pending and winner_hash is None:
+                hedge_timeout = self.hedge_delay if extra_budget > 0 else None
+                done, pending = await asyncio.wait(pending, timeout=hedge_timeout,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if not result:
+                        continue  # failed nodes never vote
+
+                    this_hash, body = result
+                    if body is not None:
+                        bodies.setdefault(this_hash, body)
+                    votes[task_to_ip[task]] = this_hash
+                    counter[this_hash] += 1
+                    if self.early_quorum and counter[this_hash] >= self.consensus:
+                        winner_hash = this_hash
+                        break
+                if winner_hash is not None:
+                    break
+
+                best_freq = counter.most_common(1)[0][1] if counter else 0
+                if best_freq >= self.consensus:
+                    n_extra = 0  # waiting for the rest just for statistics
+                elif not done:
+                    n_extra = 1  # somebody is slow
+                else:
+                    n_extra = self.consensus - best_freq - len(pending)  # votes we can't get from the cohort
+
+                n_extra = min(n_extra, extra_budget)
+                if n_extra > 0:
+                    fresh_ips = await self.node_ip_man.select_nodes(n_extra, exclude=asked)
+                    if fresh_ips:
+                        self.logger.info(f'Hedging "{path}" with extra nodes: {fresh_ips}')
+                        asked.update(fresh_ips)
+                        keep_body = not hash_only or (primary_task.done() and not bodies)
+                        fresh_tasks = self._start_requests(fresh_ips, path, task_to_ip, keep_body)
+                        pending |= fresh_tasks
+                        if keep_body:
+                            body_tasks |= fresh_tasks
+                    extra_budget -= n_extra
+
+                if best_freq + len(pending) < self.consensus:
+                    break  # quorum is unreachable even if all the rest agree
+
+            if winner_hash is None and counter:
+                most_hash, most_freq = counter.most_common(1)[0]
+                if most_freq >= self.consensus:
+                    winner_hash = most_hash
+
+            if winner_hash is not None and winner_hash not in bodies:
+                body_waits = pending & body_tasks  # not cancelled: their bodies are on the way
+        finally:
+            for task in pending - body_waits:
+                task.cancel()
+
+        if winner_hash is None:
             return None, 0.0
 
+        self._report_votes(votes, winner_hash)
+        body = bodies.get(winner_hash)
+        if body is None and body_waits:
+            body = await self._await_body(body_waits, winner_hash)
+        if body is None:
+            body = await self._fetch_agreed_body(winner_hash, votes, path)
+        return body, counter[winner_hash] / self.cohort_size
+
     async def request_random_node(self, path: str):
         node_id = await self.node_ip_man.select_node()
-        text = await self._request_one_node_as_text(node_id, path)
-        return ujson.loads(text)
+        result = await self._request_one_node(node_id, path)
+        return ujson.loads(result[1]) if result else None
+
+    LAST_BLOCK_PATH = '/thorchain/lastblock'
+    HEIGHT_RESET_FAILURES = 3  # consensus failures in a row at the learned height to forget it
+
+    @staticmethod
+    def _last_block_height(result):
+        if not result:
+            return 0
+        try:
+            return max(int(block['thorchain']) for block in ujson.loads(result[1]))
+        except (ValueError, TypeError, KeyError):
+            return 0
+
+    async def _learn_recent_height(self):
+        if self._last_height and time.monotonic() - self._last_height_ts < self.height_ttl:
+            return self._last_height
+
+        # the median of several nodes, so that one node with a bogus height can't decide it
+        node_ips = await self.node_ip_man.select_nodes(self.consensus)
+        results = await asyncio.gather(*[self._request_one_node(ip, self.LAST_BLOCK_PATH) for ip in node_ips])
+        heights = sorted(h for h in map(self._last_block_height, results) if h > 0)
+        if not heights:
+            return 0
+
+        height = heights[(len(heights) - 1) // 2] - self.height_lag
+        if height > self._last_height:  # never go back in time (the nodes may be lagging)
+            self._last_height = height
+        self._last_height_ts = time.monotonic()
+        return self._last_height
+
+    async def recent_height(self):
+        return await self._flight.run(f'height:{self.LAST_BLOCK_PATH}', self._learn_recent_height)
+
+    def _on_synced_result(self, success):
+        if success:
+            self._height_failures = 0
+            return
+        self._height_failures += 1
+        if self._height_failures >= self.HEIGHT_RESET_FAILURES:
+            self.logger.warning(f'No consensus {self._height_failures} times in a row at the height '
+                                f'{self._last_height}; learning it anew.')
+            self._last_height = 0
+            self._last_height_ts = 0.0
+            self._height_failures = 0
+
+    def _needs_height_sync(self, path: str):
+        return 'height=' not in path and path.startswith(self.height_sync_paths)
+
+    @staticmethod
+    def path_at_height(path: str, height):
+        separator = '&' if '?' in path else '?'
+        return f'{path}{separator}height={height}'
 
     async def request(self, path: str):
         if not path.startswith('/'):
             path = '/' + path
+        return await self._flight.run(path, self._request_cached, path)
+
+    async def _request_cached(self, path: str):
+        if self.cache is None:
+            return await self._request_consensus(path)
+
+        data = await self.cache.get(path)
+        if data is None:
+            data = await self._request_consensus(path)
+            await self.cache.put(path, data)
+        return data
+
+    async def _request_consensus(self, path: str):
+        synced = False
+        if self._needs_height_sync(path):
+            try:
+                height = await self.recent_height()
+                if height > 0:
+                    path = self.path_at_height(path, height)
+                    synced = True
+            except (ValueError, TypeError, KeyError) as e:
+                self.logger.warning(f'Failed to learn the recent block height ({e}); "{path}" goes unsynchronized.')
+
         node_ips = await self.node_ip_man.select_nodes(self.cohort_size)
         # node_ips[0] = '127.0.0.1'  # debug
 
         self.logger.info(f'Start request to Thor node "{path}"')
-        text_responses = await asyncio.gather(*[self._request_one_node_as_text(ip, path) for ip in node_ips])
-        best_text_response, ratio = self._consensus_response(text_responses)
-        if best_text_response is None:
+        best_response, ratio = await self._quorum_response(node_ips, path)
+
+        path_class = self.node_ip_man.path_class(path)
+        if synced:
+            self._on_synced_result(best_response is not None)
+        if best_response is None:
+            CONSENSUS_FAILURES.inc(path=path_class)
             self.logger.error(f'No consensus reached between nodes: {node_ips} for request "{path}"!')
             return None
         else:
+            CONSENSUS_RATIO.observe(ratio, path=path_class)
             self.logger.info(f'Success for the request "{path}" consensus: {(ratio * 100.0):.0f}%')
-            return ujson.loads(best_text_response)
+            return ujson.loads(best_response)
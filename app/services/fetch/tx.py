@@ -1,46 +1,102 @@
 import asyncio
-from typing import List
+import itertools
+import time
+from typing import List, Optional
+
+import ujson
 
 from services.fetch.base import BaseFetcher
 from services.lib.datetime import parse_timespan_to_seconds
+from services.lib.dedup import ExpiringDedup
 from services.lib.depcont import DepContainer
 from services.models.pool_info import PoolInfo
 from services.models.time_series import BUSD_SYMBOL
-from services.models.tx import StakeTx, StakePoolStats
+from services.models.tx import StakeTx, StakePoolStats, StakePoolStatsCache, StakeTxBatch
 
 TRANSACTION_URL = "https://chaosnet-midgard.bepswap.com/v1/txs?offset={offset}&limit={limit}&type=stake,unstake"
 
 
 class StakeTxFetcher(BaseFetcher):
     MAX_PAGE_DEEP = 10
+    KEY_CURSOR = 'tx_cursor'  # the newest tx ingested: {"date": ..., "hash": ...}; hash is "" if held by a pending tx
 
     def __init__(self, deps: DepContainer):
-        super().__init__(deps, sleep_period=60)
+        scfg = deps.cfg.tx.stake_unstake
+        super().__init__(deps, sleep_period=parse_timespan_to_seconds(scfg.fetch_period),
+                         adaptive_cfg=scfg.get('adaptive'))
 
-        self.pool_stat_map = {}
-        self.pool_info_map = {}
+        self.latest_wins = False  # every tx batch must be notified
 
-        scfg = deps.cfg.tx.stake_unstake
+        self.pool_stats = StakePoolStatsCache(deps.db)
+        self._committing = False
+        self.pool_stat_map = {}  # the pools of the current batch only
+        self.pool_info_map = {}
 
-        self.sleep_period = parse_timespan_to_seconds(scfg.fetch_period)
         self.tx_per_batch = int(scfg.tx_per_batch)
         self.max_page_deep = int(scfg.max_page_deep)
+        self.first_page_size = int(scfg.get('first_page_size', 10))  # usually it has all the news
+        self.concurrent_pages = max(1, int(scfg.get('concurrent_pages', 3)))  # when there is a backlog
+        self.cursor: Optional[dict] = None
+
+        dedup_cfg = scfg.get('dedup', {})
+        self.dedup = ExpiringDedup(deps.db, StakeTx.DEDUP_NAME,
+                                   max_age_sec=parse_timespan_to_seconds(scfg.max_age_sec),
+                                   max_local_items=int(dedup_cfg.get('memory_items', 10000)))
+        self._legacy_migrated = False
 
         self.logger.info(f"cfg.tx.stake_unstake: {scfg}")
 
     async def fetch(self):
         await self.deps.db.get_redis()
 
-        txs = await self._fetch_txs()
+        if not self._legacy_migrated:
+            n = await StakeTx.migrate_legacy_notified(self.deps.db, self.dedup)
+            if n:
+                self.logger.info(f'{n} notified txs of the old format moved to the dedup')
+            self._legacy_migrated = True
+
+        if self.cursor is None:
+            self.cursor = await self._load_cursor()
+
+        txs, next_cursor = await self._fetch_txs()
         if not txs:
+            await self._save_cursor(next_cursor)
             return []
 
         await self._load_stats(txs)
 
-        txs = await self._update_pools(txs)
-        if txs:
-            await self._mark_as_notified(txs)
-        return txs
+        await self.pool_stats.flush()  # the committed leftovers of a failed flush first
+        self._committing = True
+        committed = False
+        try:
+            txs = await self._update_pools(txs)
+            if txs:
+                await self._mark_as_notified(txs)
+            await self._save_cursor(next_cursor)
+            committed = True
+        finally:
+            if not committed:  # including the cancellation
+                self.pool_stats.forget_dirty()  # or the same txs would be counted again next time
+            self._committing = False
+        await self.pool_stats.flush()  # if it fails, the changes stay dirty till the next one
+        return self._make_batch(txs)
+
+    async def flush_pool_stats(self):
+        """ On shutdown: saves what the committed cycles have left; nothing if a cycle is still in the middle """
+        if self._committing:
+            self.logger.warning('a cycle is not committed, the pool stats are not saved')
+            return 0
+        return await self.pool_stats.flush()
+
+    def _make_batch(self, txs):
+        # the notifiers run later, the next cycle may have changed the stats by then
+        if not txs:
+            return []
+        pools = StakeTx.collect_pools(txs)
+        return StakeTxBatch(txs=txs,
+                            pool_stats={pool: self.pool_stat_map[pool].snapshot() for pool in pools},
+                            pool_infos={pool: self.pool_info_map[pool] for pool in pools},
+                            usd_per_rune=self.deps.price_holder.usd_per_rune)
 
     # -------
 
@@ -54,36 +110,90 @@ class StakeTxFetcher(BaseFetcher):
             if str(tx['status']).lower() == 'success':
                 yield StakeTx.load_from_midgard(tx)
 
-    async def _fetch_one_batch(self, session, page):
-        url = self.tx_endpoint_url(page * self.tx_per_batch, self.tx_per_batch)
+    @staticmethod
+    def _pending_dates(j):
+        # not final yet: may become a success later with the same date
+        return [int(tx['date']) for tx in j['txs'] if str(tx['status']).lower() == 'pending']
+
+    def _page_bounds(self, page):
+        """ The first page is small, in the steady state there is no more """
+        if page == 0:
+            return 0, self.first_page_size
+        return self.first_page_size + (page - 1) * self.tx_per_batch, self.tx_per_batch
+
+    async def _fetch_one_batch(self, page):
+        url = self.tx_endpoint_url(*self._page_bounds(page))
         self.logger.info(f"start fetching tx: {url}")
-        async with session.get(url) as resp:
-            json = await resp.json()
-            txs = self._parse_txs(json)
-            return list(txs)
+        json = await self.deps.http.get_json(url)
+        return list(self._parse_txs(json)), self._pending_dates(json)
+
+    def _is_behind_cursor(self, tx: StakeTx):
+        c = self.cursor
+        return bool(c) and (tx.hash == c['hash'] or tx.date < c['date'])
 
     async def _filter_new(self, txs):
-        new_txs = []
-        for tx in txs:
-            tx: StakeTx
-            if not (await tx.is_notified(self.deps.db)):
-                new_txs.append(tx)
-        return new_txs
+        # the ones older than max_age count as seen, so paging stops there too
+        seen = await self.dedup.seen([tx.dedup_item for tx in txs])
+        return [tx for tx, is_seen in zip(txs, seen) if not is_seen]
+
+    async def _new_of_page(self, txs):
+        """ -> (the new txs, has the page reached what was ingested before) """
+        ahead = list(itertools.takewhile(lambda tx: not self._is_behind_cursor(tx), txs))
+        new_txs = await self._filter_new(ahead)
+        if len(ahead) < len(txs) or (txs and self.dedup.is_too_old(txs[-1].date)):
+            return new_txs, True
+        # with a cursor, go on to it: a pending tx behind the notified ones may have become a success
+        return new_txs, not self.cursor and not new_txs
+
+    def _next_cursor(self, newest: Optional[StakeTx], pending_dates):
+        """ The newest tx, but not past the oldest pending one: it must be seen again when it is a success """
+        if newest is None:
+            return self.cursor
+        if self.cursor:
+            pending_dates = [d for d in pending_dates if d >= self.cursor['date']]  # ignore the ones behind it
+        if pending_dates and min(pending_dates) <= newest.date:
+            too_old = int(time.time()) - self.dedup.max_age_sec  # older than that will never be notified anyway
+            return {'date': max(min(pending_dates), too_old), 'hash': ''}
+        return {'date': newest.date, 'hash': newest.hash}
 
     async def _fetch_txs(self):
-        all_txs = []
-        page = 0
-        while page < self.max_page_deep:
-            txs = await self._fetch_one_batch(self.deps.session, page)
-            txs = await self._filter_new(txs)
-            if not txs:
-                self.logger.info(f"no more tx: got {len(all_txs)}")
-                break
-
-            all_txs += txs
-            page += 1
-
-        return all_txs
+        """ -> (the new txs, the cursor to move to) """
+        txs, pending_dates = await self._fetch_one_batch(0)
+        newest = txs[0] if txs else None
+        all_txs, reached = await self._new_of_page(txs)
+        if reached:
+            return all_txs, self._next_cursor(newest, pending_dates)
+
+        # a backlog: the next pages go concurrently, the ones after the watermark are not waited for
+        next_page = 1
+        pending = []
+        try:
+            while not reached and (pending or next_page < self.max_page_deep):
+                while len(pending) < self.concurrent_pages and next_page < self.max_page_deep:
+                    pending.append(asyncio.ensure_future(self._fetch_one_batch(next_page)))
+                    next_page += 1
+                txs, page_pending_dates = await pending.pop(0)
+                new_txs, reached = await self._new_of_page(txs)
+                all_txs += new_txs
+                pending_dates += page_pending_dates
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self.logger.info(f"{len(all_txs)} new txs in {next_page - len(pending)} pages")
+        return all_txs, self._next_cursor(newest, pending_dates)
+
+    async def _load_cursor(self):
+        r = await self.deps.db.get_redis()
+        raw = await r.get(self.KEY_CURSOR)
+        return ujson.loads(raw) if raw else {}
+
+    async def _save_cursor(self, cursor: dict):
+        if not cursor or cursor == self.cursor:
+            return
+        self.cursor = cursor
+        r = await self.deps.db.get_redis()
+        await r.set(self.KEY_CURSOR, ujson.dumps(self.cursor))
 
     async def _update_pools(self, txs):
         updated_stats = set()
@@ -95,7 +205,8 @@ class StakeTxFetcher(BaseFetcher):
             stats: StakePoolStats = self.pool_stat_map.get(tx.pool)
             if price and stats:
                 full_rune = tx.calc_full_rune_amount(price)
-                stats.update(full_rune, 100)
+                stats.update(full_rune, StakePoolStats.DEFAULT_MAX_N)
+                self.pool_stats.mark_dirty(tx.pool)
                 updated_stats.add(tx.pool)
                 result_txs.append(tx)
 
@@ -105,8 +216,6 @@ class StakeTxFetcher(BaseFetcher):
             pool_stat: StakePoolStats = self.pool_stat_map[pool_name]
             pool_info: PoolInfo = self.pool_info_map.get(pool_name)
             pool_stat.usd_depth = pool_info.usd_depth(self.deps.price_holder.usd_per_rune)
-            await pool_stat.write_time_series(self.deps.db)
-            await pool_stat.save(self.deps.db)
 
         self.logger.info(f'new tx to analyze: {len(result_txs)}')
 
@@ -119,11 +228,7 @@ class StakeTxFetcher(BaseFetcher):
 
         pool_names = StakeTx.collect_pools(txs)
         pool_names.add(BUSD_SYMBOL)  # don't forget BUSD, for total usd volume!
-        self.pool_stat_map = {
-            pool: (await StakePoolStats.get_from_db(pool, self.deps.db)) for pool in pool_names
-        }
+        self.pool_stat_map = await self.pool_stats.get(pool_names)
 
     async def _mark_as_notified(self, txs: List[StakeTx]):
-        await asyncio.gather(*[
-            tx.set_notified(self.deps.db) for tx in txs
-        ])
+        await self.dedup.add([tx.dedup_item for tx in txs])
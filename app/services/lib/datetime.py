@@ -127,3 +127,14 @@ def series_to_pandas(ts_result, shift_time=True):
             **values
         })
     return pd.DataFrame(normal_data)
+
+
+def parse_timespan_float(span) -> float:
+    """ Like parse_timespan_to_seconds, but keeps the fractions (0.5, "0.25") and raises ValueError if invalid """
+    try:
+        return float(span)
+    except (TypeError, ValueError):
+        seconds = parse_timespan_to_seconds(str(span))
+        if isinstance(seconds, str):
+            raise ValueError(f'bad time span "{span}": {seconds}')
+        return float(seconds)
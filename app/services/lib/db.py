@@ -1,4 +1,5 @@
 import os
+import time
 import typing
 from contextlib import asynccontextmanager
 
@@ -6,6 +7,20 @@ import aioredis
 from aiogram.contrib.fsm_storage.redis import RedisStorage2
 from aiogram.dispatcher import FSMContext
 
+from services.lib.metrics import Histogram
+
+REDIS_COMMAND_SECONDS = Histogram('redis_command_seconds', 'Redis command round-trip time',
+                                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0))
+
+
+class InstrumentedRedis(aioredis.Redis):
+    def execute(self, command, *args, **kwargs):
+        start_ts = time.monotonic()
+        fut = super().execute(command, *args, **kwargs)
+        name = (command.decode() if isinstance(command, bytes) else str(command)).lower()
+        fut.add_done_callback(lambda _: REDIS_COMMAND_SECONDS.observe(time.monotonic() - start_ts, command=name))
+        return fut
+
 
 class DB:
     def __init__(self, loop):
@@ -24,6 +39,7 @@ class DB:
             self.redis = await aioredis.create_redis(
                 f'redis://{self.host}:{self.port}',
                 password=self.password,
+                commands_factory=InstrumentedRedis,
                 loop=self.loop)
 
             self.storage = RedisStorage2(prefix='fsm')
@@ -33,6 +49,14 @@ class DB:
 
         return self.redis
 
+    async def new_connection(self) -> aioredis.Redis:
+        """ A separate connection, e.g. for pub/sub """
+        return await aioredis.create_redis(
+            f'redis://{self.host}:{self.port}',
+            password=self.password,
+            commands_factory=InstrumentedRedis,
+            loop=self.loop)
+
     async def get_storage(self):
         await self.get_redis()
         return self.storage
@@ -0,0 +1,177 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Tuple
+
+from aioredis import ReplyError
+
+from services.lib.db import DB
+from services.lib.metrics import Gauge
+
+DEDUP_LOCAL_ITEMS = Gauge('dedup_local_items', 'Items remembered in the process')
+DEDUP_REDIS_ITEMS = Gauge('dedup_redis_items', 'Items in the live Redis buckets')
+DEDUP_REDIS_BYTES = Gauge('dedup_redis_bytes', 'Memory of the live Redis buckets (MEMORY USAGE)')
+
+
+class ExpiringDedup:
+    """
+    Remembers the seen items (id, unix time) for max_age_sec; anything older counts as seen anyway.
+    The ids go to Redis sets, one per max_age_sec long time bucket, and each set expires max_age_sec after
+    its bucket ends, so no more than 2-3 sets are alive at once and Redis memory stays flat.
+    An LRU in front answers for the recent items without a round-trip.
+    """
+
+    KEY_PREFIX = 'dedup'
+    EXPIRE_SLACK_SEC = 60  # the clocks of Midgard and ours may disagree a little
+
+    def __init__(self, db: DB, name, max_age_sec, max_local_items=10000, report_period=60.0):
+        assert max_age_sec > 0
+        self.db = db
+        self.name = name
+        self.max_age_sec = int(max_age_sec)
+        self.max_local_items = max_local_items
+        self.report_period = report_period
+        self._local = OrderedDict()  # id -> ts
+        self._last_report_ts = 0.0
+        self._undated_until = None  # unknown until the first lookup
+        self.logger = logging.getLogger('ExpiringDedup')
+
+        self.local_hits = 0
+        self.redis_checks = 0
+
+    def bucket_key(self, ts):
+        return f'{self.KEY_PREFIX}:{self.name}:{int(ts) // self.max_age_sec}'
+
+    @property
+    def undated_key(self):
+        """ The items of unknown time (see add_undated) """
+        return f'{self.KEY_PREFIX}:{self.name}:undated'
+
+    def bucket_expire_at(self, ts):
+        bucket = int(ts) // self.max_age_sec
+        return (bucket + 2) * self.max_age_sec + self.EXPIRE_SLACK_SEC
+
+    def is_too_old(self, ts, now=None):
+        now = time.time() if now is None else now
+        return ts <= now - self.max_age_sec
+
+    def _remember(self, item_id, ts):
+        self._local[item_id] = ts
+        self._local.move_to_end(item_id)
+        while len(self._local) > self.max_local_items:
+            self._local.popitem(last=False)
+
+    def _forget_old(self, now):
+        # the oldest are usually at the front
+        while self._local:
+            item_id, ts = next(iter(self._local.items()))
+            if not self.is_too_old(ts, now):
+                break
+            self._local.popitem(last=False)
+
+    async def seen(self, items: List[Tuple[str, int]]) -> List[bool]:
+        """ For every (id, ts): has it been added before? At most one round-trip for all of them """
+        now = time.time()
+        self._forget_old(now)
+
+        result = [True] * len(items)
+        to_check = []  # index in items
+        for i, (item_id, ts) in enumerate(items):
+            if self.is_too_old(ts, now):
+                continue
+            if item_id in self._local:
+                self._local.move_to_end(item_id)
+                self.local_hits += 1
+                continue
+            to_check.append(i)
+
+        if to_check:
+            self.redis_checks += len(to_check)
+            r = await self.db.get_redis()
+            if self._undated_until is None:
+                ttl = await r.ttl(self.undated_key)
+                self._undated_until = now + ttl if ttl > 0 else 0.0
+            check_undated = now < self._undated_until
+
+            pipe = r.pipeline()
+            for i in to_check:
+                item_id, ts = items[i]
+                pipe.sismember(self.bucket_key(ts), item_id)
+                if check_undated:
+                    pipe.sismember(self.undated_key, item_id)
+            answers = await pipe.execute()
+            step = 2 if check_undated else 1
+            for k, i in enumerate(to_check):
+                is_member = any(answers[k * step:(k + 1) * step])
+                result[i] = is_member
+                if is_member:
+                    self._remember(*items[i])
+
+        DEDUP_LOCAL_ITEMS.set(len(self._local), name=self.name)
+        return result
+
+    async def add(self, items: List[Tuple[str, int]]):
+        now = time.time()
+        buckets = {}
+        for item_id, ts in items:
+            if not self.is_too_old(ts, now):
+                buckets.setdefault(self.bucket_key(ts), (ts, []))[1].append(item_id)
+                self._remember(item_id, ts)
+
+        if buckets:
+            r = await self.db.get_redis()
+            pipe = r.pipeline()
+            for key, (ts, ids) in buckets.items():
+                pipe.sadd(key, *ids)
+                pipe.expireat(key, self.bucket_expire_at(ts))
+            await pipe.execute()
+
+        DEDUP_LOCAL_ITEMS.set(len(self._local), name=self.name)
+        if now - self._last_report_ts >= self.report_period:
+            self._last_report_ts = now
+            await self.report_memory()
+
+    async def add_undated(self, ids: List[str]):
+        """ Seen at some time within max_age_sec: looked up by seen() regardless of the time for max_age_sec more """
+        if not ids:
+            return
+        expire_at = int(time.time()) + self.max_age_sec + self.EXPIRE_SLACK_SEC
+        r = await self.db.get_redis()
+        pipe = r.pipeline()
+        pipe.sadd(self.undated_key, *ids)
+        pipe.expireat(self.undated_key, expire_at)
+        await pipe.execute()
+        self._undated_until = expire_at
+
+    def live_bucket_keys(self, now=None):
+        now = time.time() if now is None else now
+        first, last = int(now - self.max_age_sec) // self.max_age_sec, int(now) // self.max_age_sec
+        return [self.bucket_key(b * self.max_age_sec) for b in range(first, last + 1)]
+
+    async def report_memory(self):
+        """ Sets the gauges and returns (items, bytes) of Redis; bytes is 0 where MEMORY USAGE is unavailable """
+        r = await self.db.get_redis()
+        keys = self.live_bucket_keys()
+        pipe = r.pipeline()
+        for key in keys:
+            pipe.scard(key)
+        n_items = sum(await pipe.execute())
+        n_bytes = 0
+        try:
+            for key in keys:
+                n_bytes += int(await r.execute(b'MEMORY', b'USAGE', key) or 0)
+        except ReplyError:
+            pass
+        DEDUP_REDIS_ITEMS.set(n_items, name=self.name)
+        DEDUP_REDIS_BYTES.set(n_bytes, name=self.name)
+        self.logger.info(f'"{self.name}": {len(self._local)} items in memory, '
+                         f'{n_items} items / {n_bytes} bytes in Redis; '
+                         f'{self.local_hits} answered locally, {self.redis_checks} checked in Redis.')
+        return n_items, n_bytes
+
+    @classmethod
+    async def clear_all(cls, db: DB, name):
+        r = await db.get_redis()
+        keys = [key async for key in r.iscan(match=f'{cls.KEY_PREFIX}:{name}:*')]
+        if keys:
+            await r.unlink(*keys)
@@ -3,9 +3,9 @@ import asyncio
 from dataclasses import dataclass
 
 from aiogram import Bot, Dispatcher
-from aiohttp import ClientSession
 
 from services.fetch.thor_node import ThorNode
+from services.models.cap_info import ThorInfo
 from services.models.price import LastPriceHolder
 from services.models.queue import QueueInfo
 
@@ -16,7 +16,7 @@ class DepContainer:
     db: typing.Optional['DB'] = None
     loop: typing.Optional[asyncio.BaseEventLoop] = None
 
-    session: typing.Optional[ClientSession] = None
+    http: typing.Optional['HttpClient'] = None
 
     bot: typing.Optional['Bot'] = None
     dp: typing.Optional['Dispatcher'] = None
@@ -27,3 +27,4 @@ class DepContainer:
     broadcaster: typing.Optional['Broadcaster'] = None
     price_holder: LastPriceHolder = LastPriceHolder()
     queue_holder: QueueInfo = QueueInfo.error()
+    cap_holder: ThorInfo = ThorInfo.error()
@@ -0,0 +1,217 @@
+import asyncio
+import ipaddress
+import logging
+import time
+from collections import defaultdict, Counter
+from types import SimpleNamespace
+from typing import Optional
+from urllib.parse import urlparse
+
+import aiohttp
+import ujson
+from aiohttp import ClientError
+
+from services.lib.datetime import parse_timespan_to_seconds
+from services.lib.recorder import HttpRecorder, KIND_JSON, KIND_BYTES
+from services.lib.utils import SingleFlight
+
+UPSTREAM_THORNODE = 'thornode'
+UPSTREAM_MIDGARD = 'midgard'
+UPSTREAM_DELPHI = 'delphi'
+UPSTREAM_COINGECKO = 'coingecko'
+UPSTREAM_ASGARD_CONSUMER = 'asgard-consumer'
+UPSTREAM_ASSETS = 'assets'  # TrustWallet logos
+UPSTREAM_OTHER = 'other'
+
+# host substring -> upstream; THORNodes are addressed by IP, see upstream_of
+HOST_TO_UPSTREAM = [
+    ('midgard', UPSTREAM_MIDGARD),
+    ('thorchain.info', UPSTREAM_THORNODE),
+    ('delphidigital', UPSTREAM_DELPHI),
+    ('coingecko', UPSTREAM_COINGECKO),
+    ('asgard-consumer', UPSTREAM_ASGARD_CONSUMER),
+    ('githubusercontent', UPSTREAM_ASSETS),
+    ('coinmarketcap', UPSTREAM_ASSETS),
+]
+
+DEFAULT_TIMEOUTS = {
+    UPSTREAM_THORNODE: 3.0,
+    UPSTREAM_MIDGARD: 10.0,
+    UPSTREAM_DELPHI: 10.0,
+    UPSTREAM_COINGECKO: 15.0,
+    UPSTREAM_ASGARD_CONSUMER: 20.0,
+    UPSTREAM_ASSETS: 15.0,
+    UPSTREAM_OTHER: 30.0,
+}
+
+
+class HttpClient:
+    """
+    The only aiohttp session of the app: keep-alive connection pools, DNS cache and per-upstream timeouts.
+    Usage: "async with http.get(url) as resp: ..." or "await http.get_json(url)"
+    """
+
+    def __init__(self, cfg=None):
+        cfg = cfg or {}
+        self.limit = int(cfg.get('limit', 100))
+        self.limit_per_host = int(cfg.get('limit_per_host', 10))
+        self.keepalive_timeout = float(cfg.get('keepalive_timeout', 30))
+        self.dns_ttl = int(cfg.get('dns_ttl', 300))
+        self.stats_period = parse_timespan_to_seconds(cfg.get('stats_period', '1h'))
+
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        self.timeouts.update({k: float(v) for k, v in cfg.get('timeouts', {}).items()})
+
+        # URL prefix -> replacement, to point an upstream at a local stand-in (see bench/stubs.py)
+        self.url_overrides = dict(cfg.get('url_overrides') or {})
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.stats = defaultdict(Counter)  # upstream -> {requests, new_conn, reused_conn, ...}
+        self._flight = SingleFlight()
+        self.recorder: Optional[HttpRecorder] = None  # see _get_raw
+        self.logger = logging.getLogger('HttpClient')
+
+    # ---- lifecycle ----
+
+    async def start(self):
+        if self.session is not None:
+            return self
+        connector = aiohttp.TCPConnector(limit=self.limit,
+                                         limit_per_host=self.limit_per_host,
+                                         keepalive_timeout=self.keepalive_timeout,
+                                         use_dns_cache=True,
+                                         ttl_dns_cache=self.dns_ttl)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             json_serialize=ujson.dumps,
+                                             trace_configs=[self._make_trace_config()])
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            self.report()
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    # ---- requests ----
+
+    @staticmethod
+    def upstream_of(url) -> str:
+        host = urlparse(str(url)).hostname or ''
+        try:
+            ipaddress.ip_address(host)
+            return UPSTREAM_THORNODE
+        except ValueError:
+            pass
+        for sub_host, upstream in HOST_TO_UPSTREAM:
+            if sub_host in host:
+                return upstream
+        return UPSTREAM_OTHER
+
+    def timeout_for(self, upstream, total=None) -> aiohttp.ClientTimeout:
+        total = self.timeouts.get(upstream, self.timeouts[UPSTREAM_OTHER]) if total is None else total
+        return aiohttp.ClientTimeout(total=total)
+
+    def resolve_url(self, url) -> str:
+        url = str(url)
+        for prefix, replacement in self.url_overrides.items():
+            if url.startswith(prefix):
+                return replacement + url[len(prefix):]
+        return url
+
+    def get(self, url, upstream=None, timeout=None):
+        assert self.session, 'call start() first'
+        upstream = upstream or self.upstream_of(url)  # by the original URL, even if it is overridden
+        return self.session.get(self.resolve_url(url), timeout=self.timeout_for(upstream, timeout),
+                                trace_request_ctx=SimpleNamespace(upstream=upstream))
+
+    async def _get_raw(self, kind, url, upstream=None, timeout=None):
+        if self.recorder is None:
+            async with self.get(url, upstream, timeout) as resp:
+                return resp.status, await resp.read()
+
+        if self.recorder.is_replaying:
+            return await self.recorder.replay(kind, str(url))
+
+        start_ts = time.monotonic()
+        try:
+            async with self.get(url, upstream, timeout) as resp:
+                status, body = resp.status, await resp.read()
+        except (ClientError, asyncio.TimeoutError) as e:
+            self.recorder.record(kind, str(url), time.monotonic() - start_ts, error=e)
+            raise
+        self.recorder.record(kind, str(url), time.monotonic() - start_ts, body, status)
+        return status, body
+
+    async def _get_json(self, url, upstream=None, timeout=None):
+        if self.recorder is None:
+            async with self.get(url, upstream, timeout) as resp:
+                return await resp.json(loads=ujson.loads)
+
+        status, body = await self._get_raw(KIND_JSON, url, upstream, timeout)
+        if status != 200:
+            raise ClientError(f'HTTP status {status} for {url}')
+        return ujson.loads(body)
+
+    async def get_json(self, url, upstream=None, timeout=None, coalesce=True):
+        """ With coalesce=True concurrent calls share one request and one parsed result (don't mutate it!) """
+        if coalesce:
+            return await self._flight.run(url, self._get_json, url, upstream, timeout)
+        else:
+            return await self._get_json(url, upstream, timeout)
+
+    async def get_bytes(self, url, upstream=None):
+        return await self._get_raw(KIND_BYTES, url, upstream)
+
+    # ---- statistics ----
+
+    def _make_trace_config(self):
+        async def on_request_start(_session, ctx, params):
+            ctx.upstream = getattr(ctx.trace_request_ctx, 'upstream', None) or self.upstream_of(params.url)
+            self.stats[ctx.upstream]['requests'] += 1
+
+        async def on_request_exception(_session, ctx, _params):
+            self.stats[ctx.upstream]['errors'] += 1
+
+        async def on_connection_create_end(_session, ctx, _params):
+            self.stats[ctx.upstream]['new_conn'] += 1
+
+        async def on_connection_reuseconn(_session, ctx, _params):
+            self.stats[ctx.upstream]['reused_conn'] += 1
+
+        async def on_dns_cache_hit(_session, ctx, _params):
+            self.stats[ctx.upstream]['dns_hit'] += 1
+
+        async def on_dns_cache_miss(_session, ctx, _params):
+            self.stats[ctx.upstream]['dns_miss'] += 1
+
+        tc = aiohttp.TraceConfig()
+        tc.on_request_start.append(on_request_start)
+        tc.on_request_exception.append(on_request_exception)
+        tc.on_connection_create_end.append(on_connection_create_end)
+        tc.on_connection_reuseconn.append(on_connection_reuseconn)
+        tc.on_dns_cache_hit.append(on_dns_cache_hit)
+        tc.on_dns_cache_miss.append(on_dns_cache_miss)
+        return tc
+
+    @staticmethod
+    def reuse_ratio(counter: Counter):
+        total = counter['new_conn'] + counter['reused_conn']
+        return counter['reused_conn'] / total if total else 0.0
+
+    def report(self):
+        for upstream, c in sorted(self.stats.items()):
+            self.logger.info(f'{upstream}: requests={c["requests"]}, errors={c["errors"]}, '
+                             f'connections new={c["new_conn"]} reused={c["reused_conn"]} '
+                             f'({self.reuse_ratio(c) * 100.0:.0f}% reuse), '
+                             f'dns hit={c["dns_hit"]} miss={c["dns_miss"]}')
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.stats_period)
+            self.report()
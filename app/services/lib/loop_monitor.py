@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from services.lib.metrics import Histogram, Counter
+
+LOOP_LAG_SECONDS = Histogram('event_loop_lag_seconds', 'How late the event loop wakes up a sleeping coroutine',
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_STALLS = Counter('event_loop_stalls_total', 'Loop steps longer than the threshold, by the blocking code')
+
+
+class LoopLagMonitor:
+    """
+    The coroutine measures the loop lag: how much later than asked "asyncio.sleep" returns.
+    That tells there was a blocking step, but not which one. So a watchdog thread looks at the loop's heartbeat
+    and if it has stopped for longer than the threshold, it captures the stack of the loop thread right
+    in the middle of the blocking call.
+    """
+
+    APP_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    def __init__(self, interval=0.5, threshold=0.25, stack_limit=20):
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self.max_lag = 0.0
+        self.logger = logging.getLogger('LoopLagMonitor')
+
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._stop_event = threading.Event()
+
+    def _where(self, stack):
+        # the innermost frame of our own code is the culprit, not some library below it
+        for frame in reversed(stack):
+            if frame.filename.startswith(self.APP_ROOT) and frame.filename != os.path.abspath(__file__):
+                return f'{os.path.relpath(frame.filename, self.APP_ROOT)}:{frame.lineno} {frame.name}'
+        return f'{stack[-1].name}' if stack else '?'
+
+    def _watchdog(self):
+        reported_beat = None
+        while not self._stop_event.wait(self.threshold / 2):
+            beat = self._last_beat
+            stalled_for = time.monotonic() - beat - self.interval
+            if stalled_for <= self.threshold or beat == reported_beat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame, limit=self.stack_limit)
+            reported_beat = beat  # once per stall
+
+            where = self._where(stack)
+            LOOP_STALLS.inc(where=where)
+            self.logger.warning(f'the event loop is blocked for {stalled_for:.3f}+ sec at {where}:\n' +
+                                ''.join(traceback.format_list(stack)))
+
+    async def run(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        watchdog = threading.Thread(target=self._watchdog, name='LoopLagWatchdog', daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(0.0, now - self._last_beat - self.interval)
+                self._last_beat = now
+
+                LOOP_LAG_SECONDS.observe(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if lag > self.threshold:
+                    self.logger.warning(f'event loop lag: {lag:.3f} sec.')
+        finally:
+            self._stop_event.set()
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import math
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        assert metric.name not in self.metrics, f'metric "{metric.name}" is already registered'
+        self.metrics[metric.name] = metric
+        return metric
+
+    def exposition(self):
+        """ Prometheus text format, version 0.0.4 """
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _escape(v):
+    return str(v).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(labels: dict):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_value(v):
+    if v == math.inf:
+        return '+Inf'
+    return repr(float(v))
+
+
+class Metric:
+    TYPE = 'untyped'
+
+    def __init__(self, name, help_text='', registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help_text or name
+        self._values = {}  # tuple(sorted labels) -> value
+        registry.register(self)
+
+    @staticmethod
+    def _key(labels: dict):
+        return tuple(sorted(labels.items()))
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def retain(self, label, values):
+        """ Drops the series whose `label` is not one of `values`, e.g. of the nodes that are gone """
+        values = set(values)
+        for key in list(self._values):
+            labels = dict(key)
+            if label in labels and labels[label] not in values:
+                del self._values[key]
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield f'{self.name}{_format_labels(dict(key))} {_format_value(value)}'
+
+
+class Counter(Metric):
+    TYPE = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    TYPE = 'gauge'
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    TYPE = 'histogram'
+
+    def __init__(self, name, help_text='', buckets=DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        super().__init__(name, help_text, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # bucket counts, sum, count
+        counts = state[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def counts(self):
+        """ Observation count for every label set: {((label, value), ...): count} """
+        return {key: state[2] for key, state in self._values.items()}
+
+    @contextmanager
+    def time(self, **labels):
+        start_ts = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start_ts, **labels)
+
+    def timed(self, **labels):
+        """ Decorator for both plain and async functions """
+
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+            else:
+                @wraps(func)
+                def wrapper(*args, **kwargs):
+                    with self.time(**labels):
+                        return func(*args, **kwargs)
+
+                return wrapper
+
+        return decorator
+
+    def samples(self):
+        for key, (counts, total, n) in self._values.items():
+            labels = dict(key)
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                yield f'{self.name}_bucket{_format_labels({**labels, "le": _format_value(bound)})} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(labels)} {_format_value(total)}'
+            yield f'{self.name}_count{_format_labels(labels)} {n}'
+
+
+class MetricsServer:
+    """ GET /metrics on the bot's event loop """
+
+    def __init__(self, host='0.0.0.0', port=9090, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner = None
+        self.logger = logging.getLogger('MetricsServer')
+
+    async def _handle_metrics(self, _request):
+        return web.Response(text=self.registry.exposition(), content_type='text/plain')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.logger.info(f'serving metrics at http://{self.host}:{self.port}/metrics')
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
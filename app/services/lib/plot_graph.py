@@ -5,6 +5,10 @@ import pandas as pd
 from PIL import Image
 from PIL import ImageDraw, ImageFont
 
+from services.lib.metrics import Histogram
+
+RENDER_SECONDS = Histogram('render_duration_seconds', 'Image rendering time')
+
 
 def img_to_bio(image, name):
     bio = BytesIO()
@@ -138,9 +142,10 @@ class PlotGraph:
         ...
 
     def finalize(self):
-        self._plot()
-        if self.title:
-            self._draw_title()
+        with RENDER_SECONDS.time(kind=self.__class__.__name__):
+            self._plot()
+            if self.title:
+                self._draw_title()
         return self.image
 
 
@@ -0,0 +1,114 @@
+import asyncio
+import base64
+import gzip
+import logging
+import time
+from collections import defaultdict, deque
+
+import ujson
+from aiohttp import ClientError
+
+KIND_JSON = 'json'
+KIND_BYTES = 'bytes'
+KIND_THORNODE = 'thornode'
+
+MODE_OFF = 'off'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+TIMING_ORIGINAL = 'original'  # every response takes as long as it took when recorded
+TIMING_FAST = 'fast'  # as fast as possible
+
+ERROR_TIMEOUT = 'timeout'
+
+
+class HttpRecorder:
+    """
+    Records the upstream traffic (HttpClient.get_json/get_bytes and the THORNode requests) into a gzipped
+    JSON-lines file and serves it back in the replay mode, so that a run can be reproduced offline.
+    Entries are keyed by URL; THORNode ones by path only, since the cohort is random.
+    If a key is asked for more times than it was recorded, the last response is repeated.
+    """
+
+    def __init__(self, path, mode=MODE_RECORD, timing=TIMING_ORIGINAL):
+        assert mode in (MODE_RECORD, MODE_REPLAY)
+        assert timing in (TIMING_ORIGINAL, TIMING_FAST)
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.logger = logging.getLogger('HttpRecorder')
+
+        self._file = None
+        self._start_ts = time.monotonic()
+        self._entries = defaultdict(deque)  # (kind, key) -> entries
+        self._last_entry = {}  # (kind, key) -> entry
+        self.n_entries = 0
+
+        if mode == MODE_RECORD:
+            self._file = gzip.open(path, 'at', encoding='utf-8')
+        else:
+            self._load()
+
+    @property
+    def is_recording(self):
+        return self.mode == MODE_RECORD
+
+    @property
+    def is_replaying(self):
+        return self.mode == MODE_REPLAY
+
+    def _load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                entry = ujson.loads(line)
+                self._entries[(entry['k'], entry['key'])].append(entry)
+                self.n_entries += 1
+        self.logger.info(f'loaded {self.n_entries} responses for {len(self._entries)} keys from "{self.path}"')
+
+    def record(self, kind, key, elapsed, body: bytes = None, status=200, error=None):
+        entry = {
+            't': round(time.monotonic() - self._start_ts, 4),
+            'k': kind,
+            'key': key,
+            'd': round(elapsed, 4),
+            's': status,
+        }
+        if error is not None:
+            entry['e'] = ERROR_TIMEOUT if isinstance(error, asyncio.TimeoutError) else str(error)
+        else:
+            try:
+                entry['x'] = body.decode('utf-8')  # JSON mostly
+            except UnicodeDecodeError:
+                entry['b'] = base64.b64encode(body).decode()
+        self._file.write(ujson.dumps(entry, escape_forward_slashes=False) + '\n')
+        self.n_entries += 1
+
+    def _next_entry(self, kind, key):
+        queue = self._entries.get((kind, key))
+        if queue:
+            entry = self._last_entry[(kind, key)] = queue.popleft()
+            return entry
+        entry = self._last_entry.get((kind, key))
+        if entry is None:
+            raise ClientError(f'not recorded: {kind} "{key}"')
+        return entry
+
+    async def replay(self, kind, key):
+        """ Returns (status, body) or raises the recorded error """
+        entry = self._next_entry(kind, key)
+        if self.timing == TIMING_ORIGINAL:
+            await asyncio.sleep(entry['d'])
+
+        error = entry.get('e')
+        if error == ERROR_TIMEOUT:
+            raise asyncio.TimeoutError
+        elif error is not None:
+            raise ClientError(error)
+        body = entry['x'].encode('utf-8') if 'x' in entry else base64.b64decode(entry['b'])
+        return entry['s'], body
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self.logger.info(f'{self.n_entries} responses recorded to "{self.path}"')
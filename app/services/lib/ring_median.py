@@ -0,0 +1,71 @@
+import struct
+import sys
+from array import array
+from bisect import bisect_left, insort
+
+
+class RingMedian:
+    """
+    The last `capacity` numbers in a circular array plus a sorted copy of them for the median.
+    An update is a binary search and a memmove of at most `capacity` doubles; the median is O(1).
+    """
+
+    TYPECODE = 'd'
+    HEADER = struct.Struct('<HH')  # capacity, count; then the values oldest first, float64 little-endian
+
+    def __init__(self, capacity, values=()):
+        assert 0 < capacity < 2 ** 16
+        self.capacity = capacity
+        self._ring = array(self.TYPECODE)
+        self._head = 0  # the oldest one once the ring is full
+        self._sorted = array(self.TYPECODE)
+        for v in values:
+            self.add(v)
+
+    def __len__(self):
+        return len(self._ring)
+
+    def add(self, value):
+        value = float(value)
+        if len(self._ring) < self.capacity:
+            self._ring.append(value)
+        else:
+            oldest = self._ring[self._head]
+            self._ring[self._head] = value
+            self._head = (self._head + 1) % self.capacity
+            del self._sorted[bisect_left(self._sorted, oldest)]
+        insort(self._sorted, value)
+
+    def values(self):
+        """ Oldest first """
+        return list(self._ring[self._head:]) + list(self._ring[:self._head])
+
+    @property
+    def median(self):
+        n = len(self._sorted)
+        if not n:
+            return 0.0
+        mid = n // 2
+        return self._sorted[mid] if n % 2 else (self._sorted[mid - 1] + self._sorted[mid]) / 2.0
+
+    def copy(self):
+        return self.resized(self.capacity)
+
+    def resized(self, capacity):
+        """ A copy with another capacity; the newest values are kept """
+        return RingMedian(capacity, self.values()[-capacity:])
+
+    def to_bytes(self) -> bytes:
+        data = array(self.TYPECODE, self.values())
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return self.HEADER.pack(self.capacity, len(data)) + data.tobytes()
+
+    @classmethod
+    def from_bytes(cls, raw: bytes):
+        capacity, count = cls.HEADER.unpack_from(raw)
+        data = array(cls.TYPECODE)
+        data.frombytes(raw[cls.HEADER.size:cls.HEADER.size + count * data.itemsize])
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return cls(capacity, data)
@@ -0,0 +1,111 @@
+import logging
+import time
+from dataclasses import asdict
+
+import ujson
+
+from services.fetch.base import INotified
+from services.lib.depcont import DepContainer
+from services.models.cap_info import ThorInfo
+from services.models.pool_info import PoolInfo
+from services.models.queue import QueueInfo
+
+SNAPSHOT_POOLS = 'pools'  # the pool map, the Rune price is derived from it
+SNAPSHOT_QUEUE = 'queue'
+SNAPSHOT_CAP = 'cap'
+
+SNAPSHOT_CHANNEL = 'thbot:snapshots'
+
+
+def snapshot_key(kind):
+    return f'thbot:snapshot:{kind}'
+
+
+def dump_snapshot(deps: DepContainer, kind, data) -> dict:
+    if kind == SNAPSHOT_POOLS:
+        # the price fetcher gives the fair price, but the pool map is what the dialogs need
+        return {asset: pool.as_dict() for asset, pool in deps.price_holder.pool_info_map.items()}
+    elif kind in (SNAPSHOT_QUEUE, SNAPSHOT_CAP):
+        return asdict(data)
+    raise ValueError(f'unknown snapshot kind "{kind}"')
+
+
+def apply_snapshot(deps: DepContainer, kind, data: dict):
+    if kind == SNAPSHOT_POOLS:
+        if data:
+            deps.price_holder.update({asset: PoolInfo.from_dict(j) for asset, j in data.items()})
+    elif kind == SNAPSHOT_QUEUE:
+        deps.queue_holder = QueueInfo(**data)
+    elif kind == SNAPSHOT_CAP:
+        deps.cap_holder = ThorInfo(**data)
+    else:
+        raise ValueError(f'unknown snapshot kind "{kind}"')
+
+
+class SnapshotPublisher(INotified):
+    """
+    Collector side: the fresh data of a fetcher goes to Redis. The last one is kept under its key for the
+    frontends that start later and is also published on the channel for the running ones.
+    """
+
+    def __init__(self, deps: DepContainer, kind):
+        self.deps = deps
+        self.kind = kind
+        self.logger = logging.getLogger('SnapshotPublisher')
+
+    async def on_data(self, sender, data):
+        message = ujson.dumps({
+            'kind': self.kind,
+            'ts': time.time(),
+            'data': dump_snapshot(self.deps, self.kind, data),
+        })
+        r = await self.deps.db.get_redis()
+        tr = r.multi_exec()
+        tr.set(snapshot_key(self.kind), message)
+        tr.publish(SNAPSHOT_CHANNEL, message)
+        _, n_receivers = await tr.execute()
+        self.logger.info(f'"{self.kind}" snapshot published ({n_receivers} frontends listen).')
+
+
+class SnapshotSubscriber:
+    """ Frontend side: keeps the holders of DepContainer (prices, queue, cap) up to date with the collector """
+
+    KINDS = (SNAPSHOT_POOLS, SNAPSHOT_QUEUE, SNAPSHOT_CAP)
+
+    def __init__(self, deps: DepContainer):
+        self.deps = deps
+        self.last_ts = {}  # kind -> when it was published
+        self.logger = logging.getLogger('SnapshotSubscriber')
+
+    def _apply(self, message):
+        j = ujson.loads(message)
+        kind, ts = j['kind'], float(j['ts'])
+        if ts < self.last_ts.get(kind, 0.0):
+            return  # an older one has come late
+        apply_snapshot(self.deps, kind, j['data'])
+        self.last_ts[kind] = ts
+
+    async def load(self):
+        """ The last snapshots, so that the dialogs have something before the collector publishes again """
+        r = await self.deps.db.get_redis()
+        messages = await r.mget(*[snapshot_key(kind) for kind in self.KINDS])
+        for kind, message in zip(self.KINDS, messages):
+            if message:
+                self._apply(message)
+                self.logger.info(f'"{kind}" snapshot loaded ({time.time() - self.last_ts[kind]:.0f} sec old).')
+            else:
+                self.logger.warning(f'no "{kind}" snapshot yet, is the collector running?')
+
+    async def run(self):
+        conn = await self.deps.db.new_connection()  # in the subscribed state it can do nothing else
+        try:
+            channel, = await conn.subscribe(SNAPSHOT_CHANNEL)
+            await self.load()  # whatever was published before we subscribed
+            async for message in channel.iter():
+                try:
+                    self._apply(message)
+                except (ValueError, KeyError, TypeError) as e:
+                    self.logger.error(f'bad snapshot: {e}')
+        finally:
+            conn.close()
+            await conn.wait_closed()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Callable, Awaitable, List, Optional
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_RESTARTING = 'restarting'
+JOB_DONE = 'done'
+JOB_STOPPED = 'stopped'
+
+
+@dataclass
+class JobStats:
+    state: str = JOB_PENDING
+    restarts: int = 0
+    errors: int = 0
+    last_error: str = ''
+    ticks: int = 0
+    last_run_ts: float = 0.0  # wall clock
+    last_duration: float = 0.0
+    max_duration: float = 0.0
+
+
+class Job:
+    """ A long running coroutine (usually some "run" method) under supervision """
+
+    def __init__(self, name, factory: Callable[[], Awaitable], priority=0, heavy=False, restart=True,
+                 heavy_semaphore: asyncio.Semaphore = None):
+        self.name = name
+        self.factory = factory
+        self.priority = priority
+        self.heavy = heavy
+        self.restart = restart
+        self.stats = JobStats()
+        self.task: Optional[asyncio.Task] = None
+        self.delegate_stats = None  # for the fetchers, see BaseFetcher.delegate_stats
+        self.on_stop = None
+        self._heavy_semaphore = heavy_semaphore
+
+    def report_error(self, e: Exception):
+        self.stats.errors += 1
+        self.stats.last_error = f'{e.__class__.__name__}: {e}'
+
+    @asynccontextmanager
+    async def tick(self):
+        """ Wrap one unit of work of a periodic job: timing and the concurrency cap for heavy jobs """
+        if self.heavy:
+            await self._heavy_semaphore.acquire()
+        start_ts = time.monotonic()
+        self.stats.last_run_ts = time.time()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start_ts
+            self.stats.ticks += 1
+            self.stats.last_duration = duration
+            self.stats.max_duration = max(self.stats.max_duration, duration)
+            if self.heavy:
+                self._heavy_semaphore.release()
+
+
+class JobSupervisor:
+    """
+    Owns the background jobs: starts them by priority (higher first), restarts the crashed ones with
+    exponential backoff, caps the number of heavy jobs working at once and stops everything on shutdown.
+    """
+
+    def __init__(self, max_heavy_jobs=1, restart_delay=5.0, max_restart_delay=300.0, stats_period=3600.0):
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stats_period = stats_period
+        self.heavy_semaphore = asyncio.Semaphore(max_heavy_jobs)
+        self.jobs: List[Job] = []
+        self.logger = logging.getLogger('JobSupervisor')
+
+    def register(self, name, factory: Callable[[], Awaitable], priority=0, heavy=False, restart=True) -> Job:
+        assert all(job.name != name for job in self.jobs), f'job "{name}" is already registered'
+        job = Job(name, factory, priority, heavy, restart, self.heavy_semaphore)
+        self.jobs.append(job)
+        return job
+
+    def register_fetcher(self, fetcher, priority=0, heavy=False) -> Job:
+        job = self.register(fetcher.name, fetcher.run, priority, heavy)
+        fetcher.job = job
+        job.delegate_stats = lambda: fetcher.delegate_stats
+        job.on_stop = fetcher.stop_delegates
+        return job
+
+    def start(self):
+        for job in sorted(self.jobs, key=lambda j: -j.priority):
+            if job.task is None:
+                job.task = asyncio.ensure_future(self._supervise(job))
+
+    def _backoff(self, n_failures):
+        return min(self.restart_delay * 2 ** (n_failures - 1), self.max_restart_delay)
+
+    async def _supervise(self, job: Job):
+        n_failures = 0
+        while True:
+            job.stats.state = JOB_RUNNING
+            start_ts = time.monotonic()
+            try:
+                await job.factory()
+                job.stats.state = JOB_DONE
+                self.logger.info(f'job "{job.name}" is done.')
+                return
+            except asyncio.CancelledError:
+                job.stats.state = JOB_STOPPED
+                raise
+            except Exception as e:
+                job.report_error(e)
+                self.logger.exception(f'job "{job.name}" crashed: {e}')
+                if not job.restart:
+                    job.stats.state = JOB_STOPPED
+                    return
+
+            if time.monotonic() - start_ts > self.max_restart_delay:
+                n_failures = 0  # it's been working fine for a while
+            n_failures += 1
+            delay = self._backoff(n_failures)
+            job.stats.state = JOB_RESTARTING
+            job.stats.restarts += 1
+            self.logger.warning(f'restarting "{job.name}" in {delay:.0f} sec.')
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                job.stats.state = JOB_STOPPED
+                raise
+
+    async def stop(self, timeout=10.0):
+        # the least important first
+        tasks = []
+        for job in sorted(self.jobs, key=lambda j: j.priority):
+            if job.on_stop:
+                job.on_stop()
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+                tasks.append(job.task)
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        self.report()
+        self.logger.info(f'{len(tasks)} jobs stopped.')
+
+    def table(self):
+        now = time.time()
+        header = f'{"job":<24} {"prio":>4} {"state":<10} {"ticks":>6} {"last run":>9} {"dur":>7} {"max":>7} ' \
+                 f'{"errors":>6} {"restarts":>8}  last error'
+        lines = [header]
+        for job in sorted(self.jobs, key=lambda j: -j.priority):
+            s = job.stats
+            ago = f'{now - s.last_run_ts:.0f}s ago' if s.last_run_ts else '-'
+            lines.append(f'{job.name:<24} {job.priority:>4} {s.state:<10} {s.ticks:>6} {ago:>9} '
+                         f'{s.last_duration:>6.2f}s {s.max_duration:>6.2f}s {s.errors:>6} {s.restarts:>8}  '
+                         f'{s.last_error}')
+            if job.delegate_stats:
+                for name, d_stats in job.delegate_stats().items():
+                    lines.append(f'  -> {name}: {d_stats}')
+        return '\n'.join(lines)
+
+    def report(self):
+        self.logger.info('jobs:\n' + self.table())
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.stats_period)
+            self.report()
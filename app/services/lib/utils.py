@@ -21,6 +21,35 @@ def a_result_cached(ttl=60):
     return decorator
 
 
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight call and its result.
+    Do not mutate the result: all the callers get the same object!
+    """
+
+    def __init__(self):
+        self._in_flight = {}
+
+    async def run(self, key, func, *args, **kwargs):
+        fut = self._in_flight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(func(*args, **kwargs))
+            self._in_flight[key] = fut
+
+            def forget(f):
+                if self._in_flight.get(key) is f:
+                    del self._in_flight[key]
+
+            fut.add_done_callback(forget)
+
+        # if one caller is cancelled, the others still get the result
+        return await asyncio.shield(fut)
+
+    @property
+    def n_in_flight(self):
+        return len(self._in_flight)
+
+
 class Singleton(type):
     _instances = {}
 
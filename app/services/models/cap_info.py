@@ -24,6 +24,10 @@ class ThorInfo(BaseModelMixin):
     def cap_usd(self):
         return self.price * self.cap
 
+    @property
+    def fingerprint(self):
+        return f'{self.cap}:{self.stacked}'  # not the price, it comes from the pools
+
     @property
     def is_ok(self):
         return self.cap >= 1 and self.stacked >= 1
@@ -0,0 +1,125 @@
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Deque, Optional
+
+CIRCUIT_CLOSED = 'closed'  # normal operation
+CIRCUIT_OPEN = 'open'  # the node is known to be down, nobody asks it
+CIRCUIT_HALF_OPEN = 'half-open'  # the cool-down is over, a single probe request decides
+
+
+@dataclass
+class CircuitBreaker:
+    failure_threshold: int = 3  # consecutive failures to trip
+    open_time: float = 30.0  # sec, doubles after each failed probe...
+    max_open_time: float = 600.0  # sec, ...up to this
+    state: str = CIRCUIT_CLOSED
+    failures: int = 0
+    n_trips: int = 0
+    open_until: float = 0.0
+    probing: bool = False
+
+    def is_available(self, now):
+        if self.state == CIRCUIT_OPEN and now >= self.open_until:
+            self.state = CIRCUIT_HALF_OPEN
+            self.probing = False
+        if self.state == CIRCUIT_HALF_OPEN:
+            return not self.probing
+        return self.state == CIRCUIT_CLOSED
+
+    def on_selected(self):
+        if self.state == CIRCUIT_HALF_OPEN:
+            self.probing = True
+
+    def on_success(self):
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.n_trips = 0
+        self.probing = False
+
+    def on_failure(self, now):
+        """ returns True if the circuit has just opened """
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.n_trips += 1
+            self.state = CIRCUIT_OPEN
+            self.open_until = now + min(self.open_time * 2 ** (self.n_trips - 1), self.max_open_time)
+            self.failures = 0
+            self.probing = False
+            return True
+        return False
+
+    def on_cancelled(self):
+        self.probing = False  # the probe gave no answer, let another one try
+
+
+@dataclass
+class NodeHealth:
+    latency: float = 0.0  # sec, EWMA
+    error_rate: float = 0.0  # 0..1, EWMA
+    disagree_rate: float = 0.0  # 0..1, EWMA
+    n_requests: int = 0
+    n_votes: int = 0
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+    recent_latencies: Dict[str, Deque[float]] = field(default_factory=dict)  # path class -> successful latencies
+
+    ALPHA = 0.2  # EWMA smoothing factor
+    UNKNOWN_LATENCY = 0.5  # sec, assumed for the nodes we haven't asked yet
+    LATENCY_BIAS = 0.05  # sec, so that super fast nodes don't get an infinite weight
+    MIN_WEIGHT = 1e-3  # every node gets a chance to prove itself again
+    LATENCY_WINDOW = 50  # samples per path class
+    MIN_LATENCY_SAMPLES = 5
+
+    def _ewma(self, old, new, n):
+        return new if n == 0 else old + self.ALPHA * (new - old)
+
+    def report_success(self, latency: float, path_class=''):
+        samples = self.recent_latencies.get(path_class)
+        if samples is None:
+            samples = self.recent_latencies[path_class] = deque(maxlen=self.LATENCY_WINDOW)
+        samples.append(latency)
+
+        self.latency = self._ewma(self.latency, latency, self.n_requests)
+        self.error_rate = self._ewma(self.error_rate, 0.0, self.n_requests)
+        self.n_requests += 1
+
+    def report_error(self, latency: float):
+        self.latency = self._ewma(self.latency, latency, self.n_requests)
+        self.error_rate = self._ewma(self.error_rate, 1.0, self.n_requests)
+        self.n_requests += 1
+
+    def report_cancelled(self, elapsed: float):
+        if elapsed > self.expected_latency:
+            self.latency = self._ewma(self.latency, elapsed, self.n_requests)
+            self.n_requests += 1
+
+    def report_vote(self, agreed: bool):
+        self.disagree_rate = self._ewma(self.disagree_rate, 0.0 if agreed else 1.0, self.n_votes)
+        self.n_votes += 1
+
+    def latency_quantile(self, path_class, q=0.95) -> Optional[float]:
+        samples = self.recent_latencies.get(path_class)
+        if not samples or len(samples) < self.MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    @property
+    def expected_latency(self):
+        return self.latency if self.n_requests else self.UNKNOWN_LATENCY
+
+    @property
+    def weight(self):
+        w = (1.0 - self.error_rate) ** 2 * (1.0 - self.disagree_rate) ** 2 / (
+                self.expected_latency + self.LATENCY_BIAS)
+        return max(w, self.MIN_WEIGHT)
+
+    def is_bad(self, max_error_rate, max_disagree_rate, min_samples=5):
+        return (
+                (self.n_requests >= min_samples and self.error_rate > max_error_rate) or
+                (self.n_votes >= min_samples and self.disagree_rate > max_disagree_rate)
+        )
+
+    def __str__(self):
+        return (f'latency={self.expected_latency * 1000.0:.0f}ms, errors={self.error_rate * 100.0:.0f}%, '
+                f'disagree={self.disagree_rate * 100.0:.0f}%, n={self.n_requests}, circuit={self.breaker.state}')
@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from hashlib import sha256
+from typing import Dict, List, Tuple
 
 MIDGARD_MULT = 10 ** -8
 
@@ -51,6 +53,14 @@ class PoolInfo:
                    pool_units=int(j['pool_units']),
                    status=j['status'])
 
+    @property
+    def fingerprint(self):
+        return f'{self.asset}:{self.balance_asset}:{self.balance_rune}:{self.pool_units}:{self.status}'
+
+    @staticmethod
+    def map_fingerprint(pool_map: Dict[str, 'PoolInfo']):
+        return sha256('\n'.join(pool_map[asset].fingerprint for asset in sorted(pool_map)).encode()).hexdigest()
+
     def as_dict(self):
         return {
             'balance_asset': str(self.balance_asset),
@@ -59,3 +69,28 @@ class PoolInfo:
             'asset': self.asset,
             'status': self.status
         }
+
+
+@dataclass
+class PoolMapDiff:
+    added: List[Tuple[str, str]] = field(default_factory=list)  # (asset, status)
+    removed: List[Tuple[str, str]] = field(default_factory=list)  # (asset, status)
+    changed_status: List[Tuple[str, str, str]] = field(default_factory=list)  # (asset, old status, new status)
+
+    @property
+    def has_churn(self):
+        return bool(self.added or self.removed or self.changed_status)
+
+    @classmethod
+    def compare(cls, old_map: Dict[str, PoolInfo], new_map: Dict[str, PoolInfo]):
+        diff = cls()
+        for asset in old_map.keys() | new_map.keys():
+            old, new = old_map.get(asset), new_map.get(asset)
+            if old and new:
+                if old.status != new.status:
+                    diff.changed_status.append((asset, old.status, new.status))
+            elif new:
+                diff.added.append((asset, new.status))
+            else:
+                diff.removed.append((asset, old.status))
+        return diff
@@ -14,6 +14,10 @@ class QueueInfo:
     def is_ok(self):
         return self.swap >= 0 and self.outbound >= 0
 
+    @property
+    def fingerprint(self):
+        return f'{self.swap}:{self.outbound}'
+
     @property
     def is_full(self):
         return self.swap > 0 or self.outbound > 0
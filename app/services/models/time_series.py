@@ -69,6 +69,22 @@ class TimeSeries:
         n = len(values)
         return sum(values) / n if n else None
 
+    @staticmethod
+    def time_weighted_mean(points, end_ts):
+        """ points: [(ts, value)] sorted by ts; each value holds until the next point (the last one till end_ts) """
+        if not points:
+            return None
+        total_time, acc = 0.0, 0.0
+        for (ts, value), (next_ts, _) in zip(points, points[1:] + [(max(end_ts, points[-1][0]), None)]):
+            total_time += next_ts - ts
+            acc += (next_ts - ts) * value
+        return acc / total_time if total_time > 0 else points[-1][1]
+
+    async def time_average(self, period_sec, key, max_points=10000, tolerance_sec=10):
+        """ Unlike average(), fair even if the points are not evenly spaced in time """
+        points = await self.get_last_values(period_sec, key, max_points, tolerance_sec, with_ts=True)
+        return self.time_weighted_mean(points, time.time())
+
     async def sum(self, period_sec, key, max_points=10000, tolerance_sec=10):
         values = await self.get_last_values(period_sec, key, max_points, tolerance_sec)
         return sum(values)
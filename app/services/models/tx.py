@@ -1,9 +1,13 @@
+import base64
+import json
 from dataclasses import dataclass, field
-from statistics import median
+from typing import Dict, List
 
 from services.lib.db import DB
+from services.lib.dedup import ExpiringDedup
+from services.lib.ring_median import RingMedian
 from services.lib.utils import linear_transform
-from services.models.pool_info import MIDGARD_MULT
+from services.models.pool_info import MIDGARD_MULT, PoolInfo
 from services.models.cap_info import BaseModelMixin
 from services.models.time_series import TimeSeries
 
@@ -21,7 +25,8 @@ class StakeTx(BaseModelMixin):
     full_usd: float
     asset_per_rune: float
 
-    KEY_PREFIX = 'tx_not'
+    KEY_PREFIX = 'tx_not'  # legacy: a key per notified tx
+    KEY_NOTIFIED = 'tx_notified'  # legacy: the set of the notified tx hashes
 
     @classmethod
     def load_from_midgard(cls, j):
@@ -79,22 +84,51 @@ class StakeTx(BaseModelMixin):
         self.full_rune = self.asset_amount / asset_per_rune + self.rune_amount
         return self.full_rune
 
+    DEDUP_NAME = 'tx'
+
     @property
-    def notify_key(self):
-        return f"{self.KEY_PREFIX}:{self.hash}"
+    def dedup_item(self):
+        return self.hash, self.date
 
     @classmethod
     async def clear_all_data(cls, db: DB):
         r = await db.get_redis()
-        keys = await r.keys(f'{cls.KEY_PREFIX}:*')
+        keys = [key async for key in r.iscan(match=f'{cls.KEY_PREFIX}:*')]
         if keys:
-            await r.delete(*keys)
+            await r.unlink(*keys)
+        await r.unlink(cls.KEY_NOTIFIED)
+        await ExpiringDedup.clear_all(db, cls.DEDUP_NAME)
 
-    async def is_notified(self, db: DB):
-        return bool(await db.redis.get(self.notify_key))
+    @classmethod
+    async def migrate_legacy_notified(cls, db: DB, dedup: ExpiringDedup, batch=1000):
+        """
+        The marks of the older versions (tx_not:<hash> keys, then the tx_notified set) never expire.
+        Their dates are unknown, so they are looked up regardless of the date until max_age passes.
+        """
+        r = await db.get_redis()
+        n = 0
 
-    async def set_notified(self, db: DB, value=1):
-        await db.redis.set(self.notify_key, value)
+        keys = []
+        async for key in r.iscan(match=f'{cls.KEY_PREFIX}:*', count=batch):
+            keys.append(key)
+            if len(keys) >= batch:
+                n += await cls._migrate_keys(r, dedup, keys)
+                keys = []
+        if keys:
+            n += await cls._migrate_keys(r, dedup, keys)
+
+        hashes = await r.smembers(cls.KEY_NOTIFIED, encoding='utf-8')
+        if hashes:
+            await dedup.add_undated(hashes)
+            await r.unlink(cls.KEY_NOTIFIED)
+            n += len(hashes)
+        return n
+
+    @staticmethod
+    async def _migrate_keys(r, dedup: ExpiringDedup, keys):
+        await dedup.add_undated([key.decode().split(':', 1)[1] for key in keys])
+        await r.unlink(*keys)
+        return len(keys)
 
 
 @dataclass
@@ -102,8 +136,9 @@ class StakePoolStats(BaseModelMixin):
     pool: str
     last_tx: str = ''
     usd_depth: float = 0.0
-    tx_acc: list = field(default_factory=list)
+    rune_amounts: RingMedian = field(default_factory=lambda: RingMedian(StakePoolStats.DEFAULT_MAX_N))
 
+    DEFAULT_MAX_N = 100
     KEY_PREFIX = 'stake-pool-stats-v2'
     KEY_POOL_DEPTH = 'POOL-DEPTH'
 
@@ -111,48 +146,52 @@ class StakePoolStats(BaseModelMixin):
     def key(self):
         return f"{self.KEY_PREFIX}:{self.pool}"
 
-    async def save(self, db: DB):
-        await db.get_redis()
-        await db.redis.set(self.key, self.as_json)
+    @property
+    def as_json(self):
+        return json.dumps({
+            'pool': self.pool,
+            'last_tx': self.last_tx,
+            'usd_depth': self.usd_depth,
+            'rune_amounts': base64.b64encode(self.rune_amounts.to_bytes()).decode(),
+        })
 
     @classmethod
-    async def get_from_db(cls, pool, db: DB):
-        r = await db.get_redis()
-        empty = cls(pool, '', 1, [])
-        old_j = await r.get(empty.key)
-        return cls.from_json(old_j) if old_j else empty
+    def from_json(cls, jstr):
+        d = json.loads(jstr)
+        tx_acc = d.pop('tx_acc', None)
+        if tx_acc is not None:  # the older format: a list of {"rune_amount": x}
+            amounts = RingMedian(max(len(tx_acc), cls.DEFAULT_MAX_N), (tx['rune_amount'] for tx in tx_acc))
+        else:
+            amounts = RingMedian.from_bytes(base64.b64decode(d.pop('rune_amounts')))
+        return cls(rune_amounts=amounts, **d)
 
-    def update(self, rune_amount, max_n=50):
-        self.tx_acc.append({
-            'rune_amount': rune_amount
-        })
-        n = len(self.tx_acc)
-        if n > max_n:
-            self.tx_acc = self.tx_acc[(n - max_n):]
+    def update(self, rune_amount, max_n=DEFAULT_MAX_N):
+        if self.rune_amounts.capacity != max_n:
+            self.rune_amounts = self.rune_amounts.resized(max_n)
+        self.rune_amounts.add(rune_amount)
 
     @property
     def n_elements(self):
-        return len(self.tx_acc)
+        return len(self.rune_amounts)
+
+    def snapshot(self):
+        return StakePoolStats(self.pool, self.last_tx, self.usd_depth, self.rune_amounts.copy())
 
     @property
     def median_rune_amount(self):
-        return median(tx['rune_amount'] for tx in self.tx_acc) if self.tx_acc else 0.0
+        return self.rune_amounts.median
 
     @classmethod
     async def clear_all_data(cls, db: DB):
         r = await db.get_redis()
-        keys = await r.keys(f'{cls.KEY_PREFIX}:*')
+        keys = [key async for key in r.iscan(match=f'{cls.KEY_PREFIX}:*')]
         if keys:
-            await r.delete(*keys)
+            await r.unlink(*keys)
 
     @property
     def stream_name(self):
         return f'{self.KEY_POOL_DEPTH}-{self.pool}'
 
-    async def write_time_series(self, db: DB):
-        ts = TimeSeries(self.stream_name, db)
-        await ts.add(usd_depth=self.usd_depth)
-
     TX_VS_DEPTH_CURVE = [
         (10_000, 0.2),  # if depth < 10_000 then 0.3
         (100_000, 0.12),  # if 10_000 <= depth < 100_000 then 0.3 ... 0.2
@@ -179,3 +218,66 @@ class StakePoolStats(BaseModelMixin):
             lower_percent = upper_percent
             lower_bound = upper_bound
         return cls.TX_VS_DEPTH_CURVE[-1][1]
+
+
+@dataclass(frozen=True)
+class StakeTxBatch:
+    """ For the notifiers: the new txs and the pools as they were when the txs were counted """
+    txs: List[StakeTx]
+    pool_stats: Dict[str, StakePoolStats]
+    pool_infos: Dict[str, PoolInfo]
+    usd_per_rune: float
+
+    def __bool__(self):
+        return bool(self.txs)
+
+    def __len__(self):
+        return len(self.txs)
+
+
+class StakePoolStatsCache:
+    """
+    Write-behind: the stats of a pool are read from Redis once and then live here.
+    The changed ones are saved (with their time series points) in one pipeline by flush().
+    Flush only the changes of the txs that are committed (notified and behind the cursor), forget_dirty() the rest.
+    """
+
+    def __init__(self, db: DB):
+        self.db = db
+        self._stats = {}  # pool -> StakePoolStats
+        self._dirty = set()
+
+    async def get(self, pools) -> dict:
+        missing = [pool for pool in pools if pool not in self._stats]
+        if missing:
+            r = await self.db.get_redis()
+            empty = [StakePoolStats(pool, '', 1) for pool in missing]
+            for stats, old_j in zip(empty, await r.mget(*[s.key for s in empty])):
+                self._stats[stats.pool] = StakePoolStats.from_json(old_j) if old_j else stats
+        return {pool: self._stats[pool] for pool in pools}
+
+    def mark_dirty(self, pool):
+        self._dirty.add(pool)
+
+    def forget_dirty(self):
+        """ The changes were not committed: the pools will be read from Redis again """
+        for pool in self._dirty:
+            self._stats.pop(pool, None)
+        self._dirty.clear()
+
+    @property
+    def n_dirty(self):
+        return len(self._dirty)
+
+    async def flush(self):
+        if not self._dirty:
+            return 0
+        r = await self.db.get_redis()
+        pipe = r.pipeline()
+        for pool in self._dirty:
+            stats: StakePoolStats = self._stats[pool]
+            pipe.xadd(TimeSeries(stats.stream_name, self.db).stream_name, {'usd_depth': stats.usd_depth})
+            pipe.set(stats.key, stats.as_json)
+        await pipe.execute()
+        n, self._dirty = len(self._dirty), set()
+        return n
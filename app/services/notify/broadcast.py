@@ -8,9 +8,16 @@ from aiogram.utils import exceptions
 
 from localization import LocalizationManager
 from services.lib.depcont import DepContainer
+from services.lib.metrics import Counter, Histogram
 from services.lib.texts import MessageType, BoardMessage
 
 
+BROADCAST_MESSAGES = Counter('broadcast_messages_total', 'Messages sent by Broadcaster')
+BROADCAST_ERRORS = Counter('broadcast_errors_total', 'Telegram errors while broadcasting')
+BROADCAST_SECONDS = Histogram('broadcast_duration_seconds', 'Broadcaster.broadcast duration',
+                              buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+
 class Broadcaster:
     KEY_USERS = 'thbot_users'
 
@@ -70,16 +77,21 @@ class Broadcaster:
                 kwargs = self.remove_bad_args(kwargs, dis_web_preview=True)
                 await self.bot.send_photo(chat_id, caption=text, *args, **kwargs)
         except exceptions.BotBlocked:
+            BROADCAST_ERRORS.inc(error='blocked')
             self.logger.error(f"Target [ID:{chat_id}]: blocked by user")
         except exceptions.ChatNotFound:
+            BROADCAST_ERRORS.inc(error='chat_not_found')
             self.logger.error(f"Target [ID:{chat_id}]: invalid user ID")
         except exceptions.RetryAfter as e:
+            BROADCAST_ERRORS.inc(error='flood')
             self.logger.error(f"Target [ID:{chat_id}]: Flood limit is exceeded. Sleep {e.timeout} seconds.")
             await asyncio.sleep(e.timeout + 0.1)
             return await self._send_message(chat_id, text, message_type=message_type, *args, **kwargs)  # Recursive call
         except exceptions.UserDeactivated:
+            BROADCAST_ERRORS.inc(error='deactivated')
             self.logger.error(f"Target [ID:{chat_id}]: user is deactivated")
         except exceptions.TelegramAPIError:
+            BROADCAST_ERRORS.inc(error='api_error')
             self.logger.exception(f"Target [ID:{chat_id}]: failed")
             return True  # tg error is not the reason to exclude the user
         else:
@@ -111,6 +123,7 @@ class Broadcaster:
         :return: Count of messages sent
         """
         async with self._broadcast_lock:
+            start_ts = time.monotonic()
             count = 0
             bad_ones = []
 
@@ -142,6 +155,9 @@ class Broadcaster:
 
                 await self.remove_users(bad_ones)
             finally:
+                BROADCAST_SECONDS.observe(time.monotonic() - start_ts)
+                BROADCAST_MESSAGES.inc(count, result='sent')
+                BROADCAST_MESSAGES.inc(len(bad_ones), result='failed')
                 self.logger.info(f"{count} messages successful sent (of {len(chat_ids)})")
 
             return count
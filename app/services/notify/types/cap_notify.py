@@ -24,6 +24,7 @@ class CapFetcherNotifier(INotified):
             if new_info.price <= 0:
                 new_info.price = old_info.price
             await new_info.save(d.db)
+            d.cap_holder = new_info
 
             if new_info.cap != old_info.cap:
                 await self._notify_when_cap_changed(old_info, new_info)
@@ -29,6 +29,14 @@ class PriceNotifier(INotified):
         self.ath_cooldown = parse_timespan_to_seconds(cfg.ath.cooldown)
         self.price_graph_period = parse_timespan_to_seconds(cfg.price_graph.default_period)
 
+        # the price points are written on a fixed-rate grid, so ± one fetch period always catches a point;
+        # while the pools don't change, the points are written once per heartbeat
+        fetcher_cfg = deps.cfg.get('fetcher', {})
+        max_fetch_period = max(parse_timespan_to_seconds(cfg.fetch_period),
+                               parse_timespan_to_seconds(cfg.get('adaptive', {}).get('max_period', 0)),
+                               parse_timespan_to_seconds(fetcher_cfg.get('heartbeat', '5m')))
+        self.tolerance = max_fetch_period + parse_timespan_to_seconds(fetcher_cfg.get('jitter', 0))
+
     async def on_data(self, sender, fprice: RuneFairPrice):
         # fprice.real_rune_price = 1.44  # debug!!! for ATH
         if not await self.handle_ath(fprice):
@@ -42,11 +50,18 @@ class PriceNotifier(INotified):
     CD_KEY_PRICE_FALL_NOTIFIED = 'price_notified_fall'
     CD_KEY_ATH_NOTIFIED = 'ath_notified'
 
+    async def _price_ago(self, ago, wide_tolerance):
+        price = await self.time_series.select_average_ago(ago, tolerance=self.tolerance)
+        if not price:
+            # a gap in the series (the bot was down)
+            price = await self.time_series.select_average_ago(ago, tolerance=wide_tolerance)
+        return price
+
     async def historical_get_triplet(self):
         price_1h, price_24h, price_7d = await asyncio.gather(
-            self.time_series.select_average_ago(HOUR, tolerance=MINUTE * 5),
-            self.time_series.select_average_ago(DAY, tolerance=MINUTE * 30),
-            self.time_series.select_average_ago(DAY * 7, tolerance=HOUR * 1)
+            self._price_ago(HOUR, wide_tolerance=MINUTE * 5),
+            self._price_ago(DAY, wide_tolerance=MINUTE * 30),
+            self._price_ago(DAY * 7, wide_tolerance=HOUR * 1)
         )
         return price_1h, price_24h, price_7d
 
@@ -55,7 +55,7 @@ class QueueNotifier(INotified):
         free_notified_recently = not (await cdt.can_do(k_free, self.cooldown))
         congested_notified_recently = not (await cdt.can_do(k_packed, self.cooldown))
 
-        avg_value = await ts.average(self.avg_period, key)
+        avg_value = await ts.time_average(self.avg_period, key)  # the fetch period varies (adaptive)
         if avg_value is None:
             return
 
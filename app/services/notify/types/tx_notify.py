@@ -7,7 +7,7 @@ from services.fetch.tx import StakeTxFetcher
 from services.lib.datetime import parse_timespan_to_seconds
 from services.lib.depcont import DepContainer
 from services.models.pool_info import PoolInfo, MIDGARD_MULT
-from services.models.tx import StakeTx, StakePoolStats
+from services.models.tx import StakeTx, StakePoolStats, StakeTxBatch
 
 
 class StakeTxNotifier(INotified):
@@ -22,13 +22,13 @@ class StakeTxNotifier(INotified):
         self.max_age_sec = parse_timespan_to_seconds(scfg.max_age_sec)
         self.min_usd_total = int(scfg.min_usd_total)
 
-    async def on_data(self, fetcher: StakeTxFetcher, txs: List[StakeTx]):
-        new_txs = self._filter_by_age(txs)
+    async def on_data(self, fetcher: StakeTxFetcher, batch: StakeTxBatch):
+        new_txs = self._filter_by_age(batch.txs)
 
-        usd_per_rune = self.deps.price_holder.usd_per_rune
+        usd_per_rune = batch.usd_per_rune
         min_rune_volume = self.min_usd_total / usd_per_rune
 
-        large_txs = self._filter_large_txs(fetcher, new_txs, min_rune_volume)
+        large_txs = self._filter_large_txs(batch, new_txs, min_rune_volume)
 
         large_txs = list(large_txs)
         large_txs = large_txs[:self.MAX_TX_PER_ONE_TIME]
@@ -42,8 +42,8 @@ class StakeTxNotifier(INotified):
                 loc = user_lang_map[chat_id]
                 texts = []
                 for tx in large_txs:
-                    pool = fetcher.pool_stat_map.get(tx.pool)
-                    pool_info = fetcher.pool_info_map.get(tx.pool)
+                    pool = batch.pool_stats.get(tx.pool)
+                    pool_info = batch.pool_infos.get(tx.pool)
                     texts.append(loc.notification_text_large_tx(tx, usd_per_rune, pool, pool_info))
                 return '\n\n'.join(texts)
 
@@ -56,19 +56,20 @@ class StakeTxNotifier(INotified):
                 yield tx
 
     @staticmethod
-    def _filter_large_txs(fetcher, txs, min_rune_volume=10000):
+    def _filter_large_txs(batch: StakeTxBatch, txs, min_rune_volume=10000):
         for tx in txs:
             tx: StakeTx
-            stats: StakePoolStats = fetcher.pool_stat_map.get(tx.pool)
-            pool_info: PoolInfo = fetcher.pool_info_map.get(tx.pool)
+            stats: StakePoolStats = batch.pool_stats.get(tx.pool)
+            pool_info: PoolInfo = batch.pool_infos.get(tx.pool)
+            if stats is None or pool_info is None:
+                continue
 
-            usd_depth = pool_info.usd_depth(fetcher.deps.price_holder.usd_per_rune)
+            usd_depth = pool_info.usd_depth(batch.usd_per_rune)
             min_pool_percent = stats.curve_for_tx_threshold(usd_depth)
             min_share_rune_volume = (pool_info.balance_rune * MIDGARD_MULT) * min_pool_percent
 
             # print(f"{tx.pool}: {tx.full_rune:.2f} / {min_share_rune_volume:.2f} need rune, min_pool_percent = {min_pool_percent:.2f}, "
             #       f"usd_depth = {usd_depth:.0f}")
 
-            if stats is not None:
-                if tx.full_rune >= min_rune_volume and tx.full_rune >= min_share_rune_volume:
-                    yield tx
+            if tx.full_rune >= min_rune_volume and tx.full_rune >= min_share_rune_volume:
+                yield tx
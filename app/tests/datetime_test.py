@@ -0,0 +1,13 @@
+import pytest
+
+from services.lib.datetime import parse_timespan_float
+
+
+def test_parse_timespan_float():
+    assert parse_timespan_float(0.5) == 0.5
+    assert parse_timespan_float('0.5') == 0.5
+    assert parse_timespan_float(3) == 3.0
+    assert parse_timespan_float('1m') == 60.0
+    assert parse_timespan_float('1h30s') == 3630.0
+    with pytest.raises(ValueError):
+        parse_timespan_float('soon')
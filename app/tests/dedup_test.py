@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from services.lib.dedup import ExpiringDedup
+
+
+class FakeRedis:
+    """ Just the set commands of ExpiringDedup, expiry ignored """
+
+    def __init__(self):
+        self.sets = {}
+        self.expire_at = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    async def ttl(self, key):
+        return int(self.expire_at[key] - time.time()) if key in self.expire_at else -2
+
+    async def sismember(self, key, item):
+        return int(item in self.sets.get(key, set()))
+
+    async def sadd(self, key, *items):
+        self.sets.setdefault(key, set()).update(items)
+
+    async def expireat(self, key, ts):
+        self.expire_at[key] = ts
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append(getattr(self.redis, name)(*args))
+
+    async def execute(self):
+        return [await c for c in self.calls]
+
+
+class FakeDB:
+    def __init__(self):
+        self.redis = FakeRedis()
+
+    async def get_redis(self):
+        return self.redis
+
+
+def test_dedup_buckets_and_age():
+    async def main():
+        dedup = ExpiringDedup(FakeDB(), 'tx', max_age_sec=3600, report_period=float('inf'))
+        now = int(time.time())
+        await dedup.add([('a', now), ('b', now - 3000)])
+        fresh = ExpiringDedup(dedup.db, 'tx', max_age_sec=3600)  # no LRU
+        return await fresh.seen([('a', now), ('b', now - 3000), ('c', now), ('old', now - 4000)])
+
+    assert asyncio.run(main()) == [True, True, False, True]
+
+
+def test_dedup_undated_from_previous_bucket():
+    async def main():
+        db = FakeDB()
+        await ExpiringDedup(db, 'tx', max_age_sec=3600).add_undated(['legacy'])
+        dedup = ExpiringDedup(db, 'tx', max_age_sec=3600)
+        now = int(time.time())
+        previous_bucket = (now // 3600) * 3600 - 10  # within max_age, but in the bucket before
+        return await dedup.seen([('legacy', previous_bucket), ('new', previous_bucket)])
+
+    assert asyncio.run(main()) == [True, False]
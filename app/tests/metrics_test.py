@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from services.fetch.thor_node import ThorNode, NODE_REQUEST_ERRORS
+from services.lib.metrics import Counter, Registry
+
+
+def test_retain_drops_the_other_series():
+    c = Counter('x_total', registry=Registry())
+    c.inc(node='a', error='e')
+    c.inc(node='b')
+    c.inc(error='e')
+    c.retain('node', ['a'])
+    assert c.value(node='a', error='e') == 1 and c.value(node='b') == 0 and c.value(error='e') == 1
+
+
+def test_node_labels_follow_the_active_list():
+    man = SimpleNamespace(nodes_ip=['1.1.1.1', '2.2.2.2'])
+    thor = ThorNode(man, http=None)
+    for ip in man.nodes_ip:
+        NODE_REQUEST_ERRORS.inc(node=thor._node_label(ip))
+    assert thor._node_label('9.9.9.9') == ThorNode.OTHER_NODE
+
+    man.nodes_ip = ['2.2.2.2', '3.3.3.3']  # 1.1.1.1 is gone
+    NODE_REQUEST_ERRORS.inc(node=thor._node_label('3.3.3.3'))
+    assert NODE_REQUEST_ERRORS.value(node='1.1.1.1') == 0
+    assert NODE_REQUEST_ERRORS.value(node='2.2.2.2') == 1
+    assert NODE_REQUEST_ERRORS.value(node='3.3.3.3') == 1
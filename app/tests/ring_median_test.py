@@ -0,0 +1,43 @@
+import json
+import random
+from statistics import median
+
+from services.lib.ring_median import RingMedian
+from services.models.tx import StakePoolStats
+
+
+def test_ring_median_matches_statistics():
+    rng = random.Random(1)
+    ring = RingMedian(7)
+    values = []
+    for _ in range(100):
+        x = rng.choice([rng.uniform(0, 100), 5.0])  # duplicates too
+        ring.add(x)
+        values = (values + [x])[-7:]
+        assert ring.values() == values
+        assert ring.median == median(values)
+
+
+def test_ring_median_bytes_and_resize():
+    ring = RingMedian(4, [1, 2, 3, 4, 5, 6])
+    assert ring.values() == [3, 4, 5, 6]
+
+    copy = RingMedian.from_bytes(ring.to_bytes())
+    assert copy.capacity == 4 and copy.values() == [3, 4, 5, 6]
+    assert len(ring.to_bytes()) == RingMedian.HEADER.size + 4 * 8
+
+    assert ring.resized(2).values() == [5, 6]
+    assert ring.resized(10).values() == [3, 4, 5, 6]
+    assert RingMedian(3).median == 0.0
+
+
+def test_pool_stats_migrate_from_tx_acc():
+    old = json.dumps({'pool': 'BNB.BNB', 'last_tx': '', 'usd_depth': 10.0,
+                      'tx_acc': [{'rune_amount': x} for x in (10, 30, 20)]})
+    stats = StakePoolStats.from_json(old)
+    assert stats.n_elements == 3 and stats.median_rune_amount == 20
+
+    stats.update(40, max_n=3)
+    again = StakePoolStats.from_json(stats.as_json)
+    assert again.rune_amounts.values() == [30, 20, 40]
+    assert again.median_rune_amount == 30 and again.usd_depth == 10.0
@@ -0,0 +1,50 @@
+import asyncio
+
+from services.lib.utils import SingleFlight
+
+
+def test_single_flight_shares_one_call():
+    calls = []
+
+    async def fetch(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return {'x': x}
+
+    async def main():
+        sf = SingleFlight()
+        results = await asyncio.gather(*(sf.run('a', fetch, 1) for _ in range(5)), sf.run('b', fetch, 2))
+        assert sf.n_in_flight == 0
+        return results
+
+    results = asyncio.run(main())
+    assert sorted(calls) == [1, 2]
+    assert all(r is results[0] for r in results[:5])
+    assert results[5] == {'x': 2}
+
+
+def test_single_flight_new_call_after_done():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        sf = SingleFlight()
+        return await sf.run('k', fetch), await sf.run('k', fetch)
+
+    assert asyncio.run(main()) == (1, 2)
+
+
+def test_single_flight_error_is_shared():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def main():
+        sf = SingleFlight()
+        return await asyncio.gather(sf.run('k', fail), sf.run('k', fail), return_exceptions=True)
+
+    r1, r2 = asyncio.run(main())
+    assert isinstance(r1, ValueError) and r1 is r2
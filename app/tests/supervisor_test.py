@@ -0,0 +1,82 @@
+import asyncio
+
+from services.fetch.base import BaseFetcher, INotified
+from services.lib.depcont import DepContainer
+from services.lib.supervisor import JobSupervisor
+
+
+class Busy:
+    def __init__(self):
+        self.now = self.max = 0
+
+    async def work(self, sec):
+        self.now += 1
+        self.max = max(self.max, self.now)
+        try:
+            await asyncio.sleep(sec)
+        finally:
+            self.now -= 1
+
+
+class SlowFetcher(BaseFetcher):
+    def __init__(self, busy: Busy, name, fail=False):
+        super().__init__(DepContainer(), sleep_period=0.01)
+        self.deadline = 1.0
+        self.name = name
+        self.busy = busy
+        self.fail = fail
+        self.calls = 0
+
+    async def fetch(self):
+        self.calls += 1
+        if self.fail:
+            raise ValueError('down')
+        await self.busy.work(0.01)
+        return {'n': self.calls}
+
+
+class SlowNotifier(INotified):
+    def __init__(self, busy: Busy):
+        self.busy = busy
+        self.n = 0
+
+    async def on_data(self, sender, data):
+        await self.busy.work(0.03)
+        self.n += 1
+
+
+def test_heavy_cap_covers_the_delegates():
+    async def main():
+        busy = Busy()
+        sv = JobSupervisor(max_heavy_jobs=1)
+        notifiers = []
+        for name in ('a', 'b'):
+            fetcher = SlowFetcher(busy, name)
+            notifiers.append(SlowNotifier(busy))
+            fetcher.subscribe(notifiers[-1])
+            sv.register_fetcher(fetcher, heavy=True)
+        sv.start()
+        await asyncio.sleep(1.5)
+        await sv.stop()
+        return busy, notifiers
+
+    busy, notifiers = asyncio.run(main())
+    assert busy.max == 1
+    assert all(n.n > 0 for n in notifiers)
+
+
+def test_failing_fetcher_is_restarted():
+    async def main():
+        fetcher = SlowFetcher(Busy(), 'f', fail=True)
+        fetcher.max_errors_in_row = 2
+        sv = JobSupervisor(restart_delay=0.01)
+        job = sv.register_fetcher(fetcher)
+        sv.start()
+        await asyncio.sleep(2.5)
+        await sv.stop()
+        return fetcher, job
+
+    fetcher, job = asyncio.run(main())
+    assert job.stats.restarts >= 1
+    assert 'FetcherGaveUp' in job.stats.last_error
+    assert fetcher.calls >= 2
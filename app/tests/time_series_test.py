@@ -0,0 +1,15 @@
+from services.models.time_series import TimeSeries
+
+
+def test_time_weighted_mean_uneven_sampling():
+    # a busy queue polled every 15 s for 5 min, then it is empty and polled every 5 min
+    busy = [(t, 50.0) for t in range(0, 300, 15)]
+    idle = [(300, 0.0)]
+    mean = TimeSeries.time_weighted_mean(busy + idle, end_ts=600)
+    assert mean == 25.0  # half of the time busy, half empty; the plain mean would be ~47.6
+
+
+def test_time_weighted_mean_edges():
+    assert TimeSeries.time_weighted_mean([], end_ts=10) is None
+    assert TimeSeries.time_weighted_mean([(10, 3.0)], end_ts=10) == 3.0
+    assert TimeSeries.time_weighted_mean([(0, 1.0), (10, 3.0)], end_ts=20) == 2.0
@@ -3,8 +3,6 @@ import logging
 import os
 import pickle
 
-import aiohttp
-
 from localization import LocalizationManager, RussianLocalization
 from services.dialog.lp_picture import lp_pool_picture, lp_address_summary_picture
 from services.fetch.lp import LiqPoolFetcher
@@ -13,16 +11,17 @@ from services.fetch.pool_price import PoolPriceFetcher
 from services.lib.config import Config
 from services.lib.db import DB
 from services.lib.depcont import DepContainer
+from services.lib.http_client import HttpClient
 from services.models.stake_info import CurrentLiquidity
 from services.models.time_series import BTCB_SYMBOL
 
 
 async def load_one_pool_liquidity(d: DepContainer, addr, pool=BTCB_SYMBOL):
-    async with aiohttp.ClientSession() as d.session:
+    async with HttpClient() as d.http:
         await d.db.get_redis()
         lpf = LiqPoolFetcher(d)
         ppf = PoolPriceFetcher(d)
-        d.thor_man = ThorNodeAddressManager(d.cfg.thornode.seed, d.session)
+        d.thor_man = ThorNodeAddressManager(d.cfg.thornode.seed, d.http)
         await ppf.get_current_pool_data_full()
 
         cur_liqs = await lpf.fetch_all_pool_liquidity_info(addr)
@@ -59,9 +58,9 @@ async def load_one_pool_liquidity(d: DepContainer, addr, pool=BTCB_SYMBOL):
 
 
 async def load_summary_for_address(d: DepContainer, address):
-    async with aiohttp.ClientSession() as d.session:
+    async with HttpClient() as d.http:
         await d.db.get_redis()
-        d.thor_man.session = d.session
+        d.thor_man.http = d.http
         lpf = LiqPoolFetcher(d)
         ppf = PoolPriceFetcher(d)
         await ppf.get_current_pool_data_full()
@@ -85,7 +84,8 @@ async def test_one_pool_picture_generator(d: DepContainer, addr, pool, hide):
         with open(PICKLE_PATH, 'wb') as f:
             pickle.dump(stake_report, f)
 
-    img = await lp_pool_picture(stake_report, d.loc_man.default, value_hidden=hide)
+    async with HttpClient() as http:
+        img = await lp_pool_picture(http, stake_report, d.loc_man.default, value_hidden=hide)
     img.save(PICTURE_PATH, "PNG")
     os.system(f'open "{PICTURE_PATH}"')
 
@@ -1,21 +1,18 @@
 import asyncio
 
-import aiohttp
-
 from main import App
 from services.fetch.queue import QueueFetcher
+from services.lib.http_client import HttpClient
 
 
 class ConsensusTestApp(App):
     async def main(self):
         d = self.deps
-        d.session = aiohttp.ClientSession()
-        await self.create_thor_node_connector()
-
-        fetcher = QueueFetcher(d)
-        print(await fetcher.fetch())
+        async with HttpClient() as d.http:
+            await self.create_thor_node_connector()
 
-        await d.session.close()
+            fetcher = QueueFetcher(d)
+            print(await fetcher.fetch())
 
 
 if __name__ == '__main__':
@@ -2,7 +2,6 @@ import asyncio
 import logging
 from copy import deepcopy
 
-import aiohttp
 from aiogram import Bot, Dispatcher
 from aiogram.types import ParseMode
 
@@ -12,6 +11,7 @@ from services.fetch.pool_price import PoolPriceFetcher
 from services.lib.config import Config
 from services.lib.db import DB
 from services.lib.depcont import DepContainer
+from services.lib.http_client import HttpClient
 from services.models.pool_info import PoolInfo
 from services.models.price import LastPriceHolder
 from services.notify.broadcast import Broadcaster
@@ -21,8 +21,8 @@ from services.notify.types.pool_churn import PoolChurnNotifier
 async def send_to_channel_test_message(d: DepContainer):
     d.broadcaster = Broadcaster(d)
 
-    async with aiohttp.ClientSession() as d.session:
-        d.thor_man = ThorNodeAddressManager(d.cfg.thornode.seed, d.session)
+    async with HttpClient() as d.http:
+        d.thor_man = ThorNodeAddressManager(d.cfg.thornode.seed, d.http)
         lph = LastPriceHolder()
         ppf = PoolPriceFetcher(d)
         notifier_pool_churn = PoolChurnNotifier(d)
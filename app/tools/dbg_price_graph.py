@@ -2,8 +2,6 @@ import asyncio
 import logging
 import os
 
-import aiohttp
-
 from localization import LocalizationManager, RussianLocalization, EnglishLocalization
 from services.dialog.price_picture import price_graph, price_graph_from_db
 from services.fetch.gecko_price import fill_rune_price_from_gecko
@@ -12,16 +10,17 @@ from services.lib.config import Config
 from services.lib.datetime import DAY, series_to_pandas
 from services.lib.db import DB
 from services.lib.depcont import DepContainer
+from services.lib.http_client import HttpClient
 from services.models.time_series import PriceTimeSeries, RUNE_SYMBOL, RUNE_SYMBOL_DET
 
 
 async def test_price_graph(d: DepContainer, renew=True):
-    async with aiohttp.ClientSession() as d.session:
+    async with HttpClient() as d.http:
         await d.db.get_redis()
-        d.thor_man.session = d.session
+        d.thor_man.http = d.http
 
         if renew:
-            await fill_rune_price_from_gecko(d.db, include_fake_det=True)
+            await fill_rune_price_from_gecko(d.db, d.http, include_fake_det=True)
 
         img = await price_graph_from_db(d.db, EnglishLocalization())
 
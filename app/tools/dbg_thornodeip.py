@@ -1,14 +1,13 @@
 import asyncio
 import logging
 
-import aiohttp
-
 from services.fetch.node_ip_manager import ThorNodeAddressManager
+from services.lib.http_client import HttpClient
 
 
 async def main():
-    async with aiohttp.ClientSession() as session:
-        thor_man = ThorNodeAddressManager('https://chaosnet-seed.thorchain.info/', session)
+    async with HttpClient() as http:
+        thor_man = ThorNodeAddressManager('https://chaosnet-seed.thorchain.info/', http)
         node = await thor_man.select_node()
         print(node)
 
@@ -1,7 +1,6 @@
 import asyncio
 import logging
 
-import aiohttp
 from aiogram import Bot, Dispatcher
 from aiogram.types import ParseMode
 
@@ -14,6 +13,7 @@ from services.lib.db import DB
 from services.fetch.node_ip_manager import ThorNodeAddressManager
 from services.fetch.pool_price import PoolPriceFetcher
 from services.lib.depcont import DepContainer
+from services.lib.http_client import HttpClient
 from services.lib.money import pretty_money
 from services.models.time_series import TimeSeries
 from services.models.tx import StakePoolStats
@@ -85,8 +85,8 @@ async def foo12():
 
 
 async def foo13():
-    async with aiohttp.ClientSession() as deps.session:
-        deps.thor_man = ThorNodeAddressManager(deps.cfg.thornode.seed, deps.session)
+    async with HttpClient() as deps.http:
+        deps.thor_man = ThorNodeAddressManager(deps.cfg.thornode.seed, deps.http)
         ppf = PoolPriceFetcher(deps)
         data = await ppf.get_current_pool_data_full()
     print(data)